@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import Post, Category, Profile, Comment
+from .search import get_search_backend
 
 # 1. Category Admin
 @admin.register(Category)
@@ -10,20 +11,32 @@ class CategoryAdmin(admin.ModelAdmin):
 # 2. Post Admin (With filters for active/show status)
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'category', 'is_active', 'is_show', 'created_at')
+    list_display = ('title', 'author', 'category', 'is_active', 'is_show', 'likes_count', 'comments_count', 'created_at')
     list_filter = ('is_active', 'is_show', 'category', 'created_at')
     search_fields = ('title', 'content', 'author__username')
     list_editable = ('is_active', 'is_show') # Allows quick toggling from list view
+    readonly_fields = ('likes_count', 'comments_count')
+    # Full-text search lists at most this many of the best matches
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans over every row
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        ids = get_search_backend().search(search_term, visible_only=False, limit=self.search_limit)
+        if len(ids) == self.search_limit:
+            self.message_user(
+                request, f'Showing the best {self.search_limit} matches only; refine the search to see others.',
+                messages.WARNING,
+            )
+        return queryset.filter(pk__in=ids), False
 
 # 3. Profile Admin
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'followers_count')
+    list_display = ('user', 'followers_count', 'following_count')
     search_fields = ('user__username', 'user__email')
-
-    def followers_count(self, obj):
-        return obj.followers.count()
-    followers_count.short_description = 'Followers'
+    readonly_fields = ('followers_count', 'following_count')
 
 # 4. Comment Admin
 @admin.register(Comment)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Registers the cache invalidation, search indexing, change log,
+        # timeline and trending score receivers, the query hook of the request
+        # metrics and the background tasks
+        from . import cache, changes, metrics, search, tasks, timeline, trending  # noqa: F401
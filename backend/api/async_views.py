@@ -0,0 +1,142 @@
+import functools
+
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .authentication import AsyncJWTAuthentication
+from .cache import (
+    arender_posts, arender_profile, acategory_list, apost_versions, apost_list_version, aprofile_version,
+)
+from .conditional import Validators
+from .fieldsets import requested_fields
+from .models import Post
+from .pagination import apaginate
+from .queries import aliked_post_ids, ais_following
+from .renderers import FastJSONRenderer
+from .serializers import PostSerializer, ProfileSerializer
+
+
+# Async versions of the hot read endpoints, served instead of the ones in
+# api.views when API_ASYNC_VIEWS is on (off by default, see settings).
+# DRF views are sync only, so under ASGI every request would hold one of the
+# thread-sensitive executor slots for its whole run. These are plain Django
+# async views that do the same work on the async ORM and cache API and
+# produce the same JSON; AsyncReadViewTests keeps them in step.
+#
+# Only what these views need from DRF is reproduced: JWT authentication,
+# IsAuthenticated, query_params, and exceptions turned into error responses.
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def _error(request, exc, authenticator):
+    response = exception_handler(exc, {'request': request})
+    if response is None:
+        raise exc
+    error = _json(response.data, response.status_code)
+    for header, value in response.items():
+        if header != 'Content-Type':
+            error[header] = value
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        error['WWW-Authenticate'] = authenticator.authenticate_header(request)
+    return error
+
+
+def async_api_view(authenticated=True):
+    """
+    Wraps an async GET view taking a DRF Request. With `authenticated`, the
+    request must carry a valid access token (IsAuthenticated).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            request = Request(request)
+            authenticator = AsyncJWTAuthentication()
+            try:
+                if request.method not in ('GET', 'HEAD'):
+                    raise exceptions.MethodNotAllowed(request.method)
+                if authenticated:
+                    auth = await authenticator.aauthenticate(request)
+                    if auth is None:
+                        raise exceptions.NotAuthenticated()
+                    request.user, request.auth = auth
+                return await view(request, *args, **kwargs)
+            except Exception as exc:
+                return _error(request, exc, authenticator)
+        return wrapper
+    return decorator
+
+
+async def _post_page_validators(request, post_ids, fields, versions=(), viewer_state=()):
+    # Same as views._post_page_validators
+    liked = None
+    if fields is None or 'is_liked' in fields:
+        liked = await aliked_post_ids(request.user, post_ids)
+    validators = Validators(
+        request,
+        [await apost_list_version(), *versions, *await apost_versions(post_ids)],
+        sorted(liked or ()),
+        *viewer_state,
+    )
+    return validators, liked
+
+
+@async_api_view()
+async def get_posts(request):
+    fields = requested_fields(request, PostSerializer)
+    posts = Post.objects.filter(is_active=True, is_show=True).only('id', 'created_at')
+    page = await apaginate(request, posts)
+    post_ids = [post.id for post in page.items]
+    validators, liked = await _post_page_validators(request, post_ids, fields)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(_json(page.response_data(await arender_posts(request, post_ids, fields, liked))))
+
+
+@async_api_view()
+async def get_user_profile(request):
+    validators = Validators(request, [await aprofile_version(request.user.username)])
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    profile = await arender_profile(request, request.user.username, requested_fields(request, ProfileSerializer))
+    if profile is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return validators.apply(_json(profile))
+
+
+@async_api_view(authenticated=False)
+async def get_categories(request):
+    return _json(await acategory_list())
+
+
+@async_api_view()
+async def get_profile(request, username):
+    profile_fields = requested_fields(request, ProfileSerializer, prefix='profile_')
+    post_fields = requested_fields(request, PostSerializer)
+
+    posts = Post.objects.filter(author__username=username, is_active=True, is_show=True).only('id', 'created_at')
+    page = await apaginate(request, posts)
+    post_ids = [post.id for post in page.items]
+
+    following = None
+    if profile_fields is None or 'is_following' in profile_fields:
+        following = await ais_following(request.user, username)
+    validators, liked = await _post_page_validators(
+        request, post_ids, post_fields, versions=[await aprofile_version(username)], viewer_state=[following]
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    profile = await arender_profile(request, username, profile_fields, following)
+    if profile is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return validators.apply(_json({
+        'profile': profile,
+        'posts': page.response_data(await arender_posts(request, post_ids, post_fields, liked)),
+    }))
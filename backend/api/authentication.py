@@ -0,0 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import BlacklistMixin
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import stats, user_version, auser_version
+
+
+# JWT authentication with the user resolved from a short-lived in-process cache.
+# simplejwt loads the User row on every request, and views then load
+# request.user.profile on top. Here the user is loaded once together with the
+# profile and kept under (user id, version) for API_AUTH_CACHE_TIMEOUT seconds.
+# The version lives in the API cache and is bumped by api.cache when the user
+# or profile is saved or deleted (deactivation, password changes) and when one
+# of the user's tokens is blacklisted (logout), so those take effect on the
+# next request rather than after the timeout.
+#
+# That only holds across workers when the API cache alias is shared between
+# them (Redis, Memcached). With the default per-process LocMemCache the bump
+# reaches the process that made the change; the others keep accepting a
+# deactivated or logged-out user until their entry expires, for up to
+# API_AUTH_CACHE_TIMEOUT seconds. Lower the timeout (0 disables the cache) if
+# that lag matters and no shared backend is configured.
+#
+# Counters on the cached profile (followers_count, ...) are updated in SQL
+# without a save and may lag by up to the timeout; nothing reads them from
+# request.user. The cache pickles, so every request gets its own copy.
+
+def get_auth_cache():
+    return caches[getattr(settings, 'API_AUTH_CACHE_ALIAS', 'default')]
+
+
+def auth_timeout():
+    return getattr(settings, 'API_AUTH_CACHE_TIMEOUT', 60)
+
+
+def user_key(user_id, version):
+    return f'api:auth:{user_id}:{version}'
+
+
+def _queries_on_verify(token_class):
+    return issubclass(token_class, BlacklistMixin) and apps.is_installed('rest_framework_simplejwt.token_blacklist')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        cache = get_auth_cache()
+        key = user_key(user_id, user_version(user_id))
+        user = cache.get(key)
+        if user is None:
+            stats.record('auth', misses=1)
+            user = self.load_user(user_id)
+            cache.set(key, user, auth_timeout())
+        else:
+            stats.record('auth', hits=1)
+        return self.check_user(user, validated_token)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+    def user_query(self, user_id):
+        return self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).select_related('profile')
+
+    def load_user(self, user_id):
+        try:
+            return self.user_query(user_id).get()
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+
+    def check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    CachedJWTAuthentication for the async views in api.async_views. Access
+    tokens are verified without touching the database, so only token classes
+    that consult the blacklist are verified in a worker thread. The auth cache
+    is in-process, so it is read directly.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        if any(_queries_on_verify(token_class) for token_class in api_settings.AUTH_TOKEN_CLASSES):
+            validated_token = await sync_to_async(self.get_validated_token)(raw_token)
+        else:
+            validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        cache = get_auth_cache()
+        key = user_key(user_id, await auser_version(user_id))
+        user = cache.get(key)
+        if user is None:
+            stats.record('auth', misses=1)
+            try:
+                user = await self.user_query(user_id).aget()
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+            cache.set(key, user, auth_timeout())
+        else:
+            stats.record('auth', hits=1)
+        return self.check_user(user, validated_token)
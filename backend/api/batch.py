@@ -0,0 +1,151 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_post_list, invalidate_posts
+from .changes import record
+from .counters import bump_many
+from .models import Post, Comment, PostChange
+from .relations import set_likes
+from .search import index_later
+from .serializers import PostSerializer, CommentSerializer
+from .timeline import fan_out_posts
+from .trending import comments_added
+
+
+# Batch writes for imports and offline clients (posts/batch/, comments/batch/,
+# likes/batch/). Every item is validated by the serializer of the one-item
+# endpoint; the valid ones are written in one transaction with bulk statements
+# and the response reports each item in request order, so one bad item does
+# not sink the rest.
+#
+# bulk_create() sends no post_save, so the per-row work the signal receivers
+# would do (cache invalidation, change log, search index, counters, trending
+# scores, timeline fan-out) is done here once for the whole batch.
+
+def batch_limit():
+    return getattr(settings, 'API_BATCH_LIMIT', 100)
+
+
+def get_items(request):
+    """
+    The item list of a batch request: a JSON array, or {"items": [...]}.
+    """
+    data = request.data
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValidationError({'items': 'Expected a list of items.'})
+    if len(items) > batch_limit():
+        raise ValidationError({'items': f'At most {batch_limit()} items per batch.'})
+    return items
+
+
+def validate(serializer, items):
+    """
+    Runs the serializer's per-item validation on every item. Returns
+    ({index: validated data}, {index: errors}).
+    """
+    valid, errors = {}, {}
+    for index, item in enumerate(items):
+        try:
+            valid[index] = serializer.child.run_validation(item)
+        except ValidationError as e:
+            errors[index] = serializers.as_serializer_error(e)
+    return valid, errors
+
+
+def results(count, data, errors, status_code=status.HTTP_201_CREATED):
+    """
+    The response body: one {"status", "data"} or {"status", "errors"} entry
+    per item, in request order.
+    """
+    entries = []
+    for index in range(count):
+        if index in errors:
+            entries.append({'status': status.HTTP_400_BAD_REQUEST, 'errors': errors[index]})
+        else:
+            entries.append({'status': status_code, 'data': data[index]})
+    return {'results': entries, 'succeeded': count - len(errors), 'failed': len(errors)}
+
+
+# --- Posts ---
+
+def create_posts(user, items, context):
+    """
+    Returns ({index: new post}, {index: errors}).
+    """
+    valid, errors = validate(PostSerializer(data=items, many=True, context=context), items)
+    with transaction.atomic():
+        posts = Post.objects.bulk_create(Post(author=user, **data) for data in valid.values())
+        post_ids = [post.pk for post in posts]
+        invalidate_posts(post_ids)
+        invalidate_post_list()
+        record(post_ids, PostChange.POST)
+        index_later(post_ids)
+    # After commit, like create_post
+    fan_out_posts(posts)
+    return dict(zip(valid, posts)), errors
+
+
+# --- Comments ---
+
+class CommentItemSerializer(CommentSerializer):
+    # Checked for the whole batch in one query, see add_comments()
+    post = serializers.IntegerField(write_only=True)
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['post']
+
+
+def add_comments(user, items, context):
+    """
+    Returns ({index: new comment}, {index: errors}).
+    """
+    valid, errors = validate(CommentItemSerializer(data=items, many=True, context=context), items)
+    existing = set(
+        Post.objects.filter(pk__in={data['post'] for data in valid.values()}).values_list('pk', flat=True)
+    )
+    for index, data in list(valid.items()):
+        if data['post'] not in existing:
+            errors[index] = {'post': [f'Invalid pk "{data["post"]}" - object does not exist.']}
+            del valid[index]
+
+    with transaction.atomic():
+        comments = Comment.objects.bulk_create(
+            Comment(user=user, post_id=data['post'], content=data['content']) for data in valid.values()
+        )
+        added = Counter(comment.post_id for comment in comments)
+        bump_many(Post, 'comments_count', added)
+        invalidate_posts(added)
+        record(added, PostChange.POST)
+        index_later(added)
+        comments_added(added)
+    return dict(zip(valid, comments)), errors
+
+
+# --- Likes ---
+
+class LikeItemSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    liked = serializers.BooleanField(default=True)
+
+
+def set_like_items(user, items):
+    """
+    Returns ({index: {'post', 'is_liked', 'likes_count'}}, {index: errors}).
+    Later items for the same post win.
+    """
+    valid, errors = validate(LikeItemSerializer(data=items, many=True), items)
+    liked = {data['post']: data['liked'] for data in valid.values()}
+    counts = set_likes(user.id, liked)
+    states = {}
+    for index, data in valid.items():
+        post_id = data['post']
+        if post_id in counts:
+            states[index] = {'post': post_id, 'is_liked': liked[post_id], 'likes_count': counts[post_id]}
+        else:
+            errors[index] = {'post': [f'Invalid pk "{post_id}" - object does not exist.']}
+    return states, errors
@@ -0,0 +1,524 @@
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .models import Post, Profile, Comment, Category
+from .fieldsets import FULL, covering_preset, presets_of, select
+from .flat import post_rows, apost_rows
+from .queries import plan_posts, attach_latest_comments, liked_post_ids, aliked_post_ids, is_following, ais_following
+from .serializers import PostSerializer, ProfileSerializer, CategorySerializer
+
+
+# Response cache for the read endpoints.
+# Shared parts are cached once for everybody: one entry per post body, one per
+# profile summary and one for the category list. Per-viewer parts (is_liked,
+# is_following) are never cached; they are looked up for the whole page in one
+# query and patched in. Entries are dropped by the model signals at the bottom,
+# so a write is visible on the next read rather than after a timeout.
+#
+# Cached bodies hold site-relative image URLs; absolutize() turns them into
+# the absolute URLs the serializers produce for the current request.
+#
+# Every post and profile also has a version (the time it last changed) that
+# the same signals bump; api.conditional turns versions into ETag and
+# Last-Modified validators without rendering anything.
+#
+# Bodies are cached per fieldset preset (see api.fieldsets): a ?fields= request
+# is served from the smallest preset that covers it, so a summary list never
+# loads comments or avatars just to throw them away.
+
+CATEGORIES_KEY = 'api:categories'
+POST_LIST_VERSION_KEY = 'api:version:post-list'
+
+URL_FIELDS = ('image', 'image_preview', 'author_image', 'user_image', 'profile_image', 'background_image')
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+async def _acall(cache, method, *args):
+    # Django's async cache methods run the sync ones in a thread; an in-process
+    # cache never blocks, so async views skip that round trip
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return getattr(cache, method)(*args)
+    return await getattr(cache, f'a{method}')(*args)
+
+
+def timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+
+POST_PRESETS = tuple(presets_of(PostSerializer))
+PROFILE_PRESETS = tuple(presets_of(ProfileSerializer))
+
+
+def post_key(pk, preset=FULL):
+    return f'api:post:{preset}:{pk}'
+
+
+def profile_key(username, preset=FULL):
+    return f'api:profile:{preset}:{username}'
+
+
+def post_version_key(pk):
+    return f'api:version:post:{pk}'
+
+
+def profile_version_key(username):
+    return f'api:version:profile:{username}'
+
+
+def user_version_key(user_id):
+    # Versions the cached request.user (see api.authentication)
+    return f'api:version:user:{user_id}'
+
+
+class CacheStats:
+    """
+    Thread-safe hit/miss counters per cached namespace.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, namespace, hits=0, misses=0):
+        with self._lock:
+            self._counts[namespace]['hits'] += hits
+            self._counts[namespace]['misses'] += misses
+
+    def snapshot(self):
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def absolutize(value, base):
+    if isinstance(value, list):
+        return [absolutize(item, base) for item in value]
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in URL_FIELDS and isinstance(item, str) and item.startswith('/'):
+                result[key] = base + item
+            else:
+                result[key] = absolutize(item, base)
+        return result
+    return value
+
+
+def _base_url(request):
+    return request.build_absolute_uri('/')[:-1]
+
+
+# --- Posts ---
+# Every reader has an async twin (a-prefixed) for the async views in
+# api.async_views; both share the pure parts below.
+
+def _split_hits(post_ids, preset, found):
+    bodies = {pk: found[post_key(pk, preset)] for pk in post_ids if post_key(pk, preset) in found}
+    missing = [pk for pk in post_ids if pk not in bodies]
+    stats.record('post', hits=len(bodies), misses=len(missing))
+    return bodies, missing
+
+
+def _serialize_posts(post_ids, fields):
+    posts = plan_posts(Post.objects.filter(pk__in=post_ids), fields)
+    if 'comments' in fields:
+        posts = attach_latest_comments(posts)
+    return PostSerializer(posts, many=True, fields=fields).data
+
+
+def _fast_rendering():
+    return getattr(settings, 'API_FAST_RENDERING', False)
+
+
+def post_bodies(post_ids, preset=FULL):
+    """
+    Shared (viewer-independent) representations of the given posts in the
+    given preset, keyed by id. Misses are loaded with the planned list query
+    and written back.
+    """
+    cache = get_cache()
+    bodies, missing = _split_hits(post_ids, preset, cache.get_many([post_key(pk, preset) for pk in post_ids]))
+    if missing:
+        fields = presets_of(PostSerializer)[preset]
+        items = post_rows(missing, fields) if _fast_rendering() else _serialize_posts(missing, fields)
+        fresh = {item['id']: dict(item) for item in items}
+        cache.set_many({post_key(pk, preset): body for pk, body in fresh.items()}, timeout())
+        bodies.update(fresh)
+    return bodies
+
+
+async def apost_bodies(post_ids, preset=FULL):
+    cache = get_cache()
+    found = await _acall(cache, 'get_many', [post_key(pk, preset) for pk in post_ids])
+    bodies, missing = _split_hits(post_ids, preset, found)
+    if missing:
+        fields = presets_of(PostSerializer)[preset]
+        if _fast_rendering():
+            items = await apost_rows(missing, fields)
+        else:
+            items = await sync_to_async(_serialize_posts)(missing, fields)
+        fresh = {item['id']: dict(item) for item in items}
+        await _acall(cache, 'set_many', {post_key(pk, preset): body for pk, body in fresh.items()}, timeout())
+        bodies.update(fresh)
+    return bodies
+
+
+def _with_liked(fields):
+    return fields is None or 'is_liked' in fields
+
+
+def _assemble_posts(request, post_ids, bodies, fields, liked):
+    base = _base_url(request)
+    results = []
+    for pk in post_ids:
+        body = bodies.get(pk)
+        if body is None:
+            # Deleted between the page query and now
+            continue
+        item = absolutize(select(body, fields), base)
+        if _with_liked(fields):
+            item['is_liked'] = pk in liked
+        results.append(item)
+    return results
+
+
+def render_posts(request, post_ids, fields=None, liked=None):
+    """
+    The serialized posts for `post_ids` in order, as PostSerializer would
+    render them for this request, limited to `fields` (None = all). `liked`
+    is the viewer's liked_post_ids() when the caller already looked it up.
+    """
+    bodies = post_bodies(post_ids, covering_preset(PostSerializer, fields))
+    if _with_liked(fields) and liked is None:
+        liked = liked_post_ids(request.user, post_ids)
+    return _assemble_posts(request, post_ids, bodies, fields, liked)
+
+
+async def arender_posts(request, post_ids, fields=None, liked=None):
+    bodies = await apost_bodies(post_ids, covering_preset(PostSerializer, fields))
+    if _with_liked(fields) and liked is None:
+        liked = await aliked_post_ids(request.user, post_ids)
+    return _assemble_posts(request, post_ids, bodies, fields, liked)
+
+
+# --- Profiles ---
+
+def _profile_query(username):
+    return Profile.objects.select_related('user').filter(user__username=username)
+
+
+def _profile_body(profile, preset):
+    # Rendered without a request, so is_following is not looked up here
+    return dict(ProfileSerializer(profile, fields=presets_of(ProfileSerializer)[preset]).data)
+
+
+def profile_summary(username, preset=FULL):
+    """
+    Shared representation of a profile in the given preset, or None if there
+    is no such user.
+    """
+    cache = get_cache()
+    key = profile_key(username, preset)
+    body = cache.get(key)
+    if body is not None:
+        stats.record('profile', hits=1)
+        return body
+    stats.record('profile', misses=1)
+    profile = _profile_query(username).first()
+    if profile is None:
+        return None
+    body = _profile_body(profile, preset)
+    cache.set(key, body, timeout())
+    return body
+
+
+async def aprofile_summary(username, preset=FULL):
+    cache = get_cache()
+    key = profile_key(username, preset)
+    body = await _acall(cache, 'get', key)
+    if body is not None:
+        stats.record('profile', hits=1)
+        return body
+    stats.record('profile', misses=1)
+    profile = await _profile_query(username).afirst()
+    if profile is None:
+        return None
+    body = _profile_body(profile, preset)
+    await _acall(cache, 'set', key, body, timeout())
+    return body
+
+
+def _with_following(fields):
+    return fields is None or 'is_following' in fields
+
+
+def render_profile(request, username, fields=None, following=None):
+    body = profile_summary(username, covering_preset(ProfileSerializer, fields))
+    if body is None:
+        return None
+    item = absolutize(select(body, fields), _base_url(request))
+    if _with_following(fields):
+        item['is_following'] = is_following(request.user, username) if following is None else following
+    return item
+
+
+async def arender_profile(request, username, fields=None, following=None):
+    body = await aprofile_summary(username, covering_preset(ProfileSerializer, fields))
+    if body is None:
+        return None
+    item = absolutize(select(body, fields), _base_url(request))
+    if _with_following(fields):
+        item['is_following'] = await ais_following(request.user, username) if following is None else following
+    return item
+
+
+# --- Categories ---
+
+def category_list():
+    cache = get_cache()
+    data = cache.get(CATEGORIES_KEY)
+    if data is not None:
+        stats.record('categories', hits=1)
+        return data
+    stats.record('categories', misses=1)
+    data = [dict(item) for item in CategorySerializer(Category.objects.all(), many=True).data]
+    cache.set(CATEGORIES_KEY, data, timeout())
+    return data
+
+
+async def acategory_list():
+    cache = get_cache()
+    data = await _acall(cache, 'get', CATEGORIES_KEY)
+    if data is not None:
+        stats.record('categories', hits=1)
+        return data
+    stats.record('categories', misses=1)
+    categories = [category async for category in Category.objects.all()]
+    data = [dict(item) for item in CategorySerializer(categories, many=True).data]
+    await _acall(cache, 'set', CATEGORIES_KEY, data, timeout())
+    return data
+
+
+# --- Versions ---
+
+def versions(keys):
+    """
+    The version (a timestamp) stored under each key, in order. A missing
+    version (never bumped, or evicted) starts at "now", which can only make
+    clients download again, never miss a change.
+    """
+    cache = get_cache()
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time()
+        for key in missing:
+            # add() keeps a version another request stored in the meantime
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+        for key in missing:
+            found.setdefault(key, now)
+    return [found[key] for key in keys]
+
+
+async def aversions(keys):
+    cache = get_cache()
+    found = await _acall(cache, 'get_many', keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time()
+        for key in missing:
+            await _acall(cache, 'add', key, now, None)
+        found.update(await _acall(cache, 'get_many', missing))
+        for key in missing:
+            found.setdefault(key, now)
+    return [found[key] for key in keys]
+
+
+def post_versions(post_ids):
+    return versions([post_version_key(pk) for pk in post_ids])
+
+
+async def apost_versions(post_ids):
+    return await aversions([post_version_key(pk) for pk in post_ids])
+
+
+def profile_version(username):
+    return versions([profile_version_key(username)])[0]
+
+
+async def aprofile_version(username):
+    return (await aversions([profile_version_key(username)]))[0]
+
+
+def user_version(user_id):
+    return versions([user_version_key(user_id)])[0]
+
+
+async def auser_version(user_id):
+    return (await aversions([user_version_key(user_id)]))[0]
+
+
+def post_list_version():
+    return versions([POST_LIST_VERSION_KEY])[0]
+
+
+async def apost_list_version():
+    return (await aversions([POST_LIST_VERSION_KEY]))[0]
+
+
+# --- Invalidation ---
+
+def _delete(keys):
+    keys = list(keys)
+    if not keys:
+        return
+    cache = get_cache()
+    cache.delete_many(keys)
+    # Again after commit, in case a reader cached the old rows in between
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _bump(keys):
+    keys = list(keys)
+    if not keys:
+        return
+    cache = get_cache()
+    cache.set_many(dict.fromkeys(keys, time.time()), None)
+    # Again after commit, so a response rendered from the old rows in between
+    # does not keep the new version
+    transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time()), None))
+
+
+def invalidate_posts(post_ids):
+    post_ids = list(post_ids)
+    _delete(post_key(pk, preset) for pk in post_ids for preset in POST_PRESETS)
+    _bump(post_version_key(pk) for pk in post_ids)
+
+
+def invalidate_profiles(usernames):
+    usernames = list(usernames)
+    _delete(profile_key(username, preset) for username in usernames for preset in PROFILE_PRESETS)
+    _bump(profile_version_key(username) for username in usernames)
+
+
+def invalidate_post_list():
+    # New, hidden or deleted posts change which posts a list holds
+    _bump([POST_LIST_VERSION_KEY])
+
+
+def invalidate_users(user_ids):
+    _bump(user_version_key(pk) for pk in user_ids)
+
+
+def invalidate_categories():
+    _delete([CATEGORIES_KEY])
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_posts([instance.pk])
+    invalidate_post_list()
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    invalidate_posts([instance.post_id])
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_posts([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_posts(instance.liked_posts.values_list('pk', flat=True))
+    else:
+        invalidate_posts(pk_set)
+
+
+def invalidate_posts_showing(user_id):
+    # Post bodies embed the author's and the latest commenters' names and avatars
+    posts = Post.objects.filter(Q(author_id=user_id) | Q(comments__user_id=user_id)).distinct()
+    invalidate_posts(posts.values_list('pk', flat=True))
+
+
+@receiver(post_init, sender=Profile)
+def remember_profile_image(sender, instance, **kwargs):
+    instance._initial_profile_image_id = instance.profile_image_id
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # Without loading it when the query deferred it
+    instance._initial_username = instance.__dict__.get('username')
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    username = User.objects.filter(pk=instance.user_id).values_list('username', flat=True).first()
+    if username is not None:
+        invalidate_profiles([username])
+    invalidate_users([instance.user_id])
+    if instance.profile_image_id != instance._initial_profile_image_id or kwargs.get('signal') is post_delete:
+        invalidate_posts_showing(instance.user_id)
+        instance._initial_profile_image_id = instance.profile_image_id
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only stamp last_login, which no cached body or auth check reads
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    renamed = instance._initial_username not in (None, instance.username)
+    invalidate_profiles({instance._initial_username, instance.username} - {None})
+    # Also covers deactivation and password changes
+    invalidate_users([instance.pk])
+    if renamed:
+        # A rename: drop the bodies that show the old name
+        invalidate_posts_showing(instance.pk)
+        instance._initial_username = instance.username
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, **kwargs):
+    # Logout (LogoutView) and refresh token rotation
+    invalidate_users([instance.token.user_id])
+
+
+@receiver(m2m_changed, sender=Profile.followers.through)
+def followers_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    profile_ids = {instance.pk} | set(pk_set or ())
+    invalidate_profiles(Profile.objects.filter(pk__in=profile_ids).values_list('user__username', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_categories()
+    # Post bodies embed the category name
+    invalidate_posts(Post.objects.filter(category_id=instance.pk).values_list('pk', flat=True))
@@ -0,0 +1,173 @@
+import base64
+import binascii
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Post, Comment, PostChange
+
+
+# Change log for delta sync (/api/posts/changes/?since=<token>).
+# Signals on Post, Comment and likes append a PostChange row and drop the
+# post's older rows, so the log holds at most two rows per post plus delete
+# tombstones. Tombstones are pruned after CHANGE_LOG_RETENTION_DAYS by
+# `manage.py compact_changes`; a token older than that may have missed a
+# delete, so the client is told to reset (re-fetch the feed) instead.
+#
+# Only changes made through the ORM are seen: bulk updates and changes to
+# authors or categories shown inside a post are not logged. Positions rely on
+# ids being committed in order, which holds on SQLite (one writer at a time).
+
+def retention():
+    return timedelta(days=getattr(settings, 'CHANGE_LOG_RETENTION_DAYS', 30))
+
+
+def record(post_ids, kind):
+    """
+    Logs `kind` for the given posts, replacing the rows it supersedes.
+    """
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    superseded = PostChange.objects.filter(post_id__in=post_ids)
+    if kind == PostChange.COUNTS:
+        # A full change the client may not have seen yet must stay, so a post
+        # keeps at most one full row and one counts row
+        superseded = superseded.filter(kind=PostChange.COUNTS)
+    superseded.delete()
+    PostChange.objects.bulk_create(PostChange(post_id=pk, kind=kind) for pk in post_ids)
+
+
+def compact(now=None):
+    """
+    Prunes expired tombstones and the duplicate rows concurrent writers can
+    leave behind (more than one row of a kind per post). Returns the number
+    of rows removed.
+    """
+    now = now or timezone.now()
+    removed, _ = PostChange.objects.filter(kind=PostChange.DELETE, created_at__lt=now - retention()).delete()
+    duplicated = (
+        PostChange.objects.values('post_id', 'kind')
+        .annotate(rows=Count('id'), last=Max('id'))
+        .filter(rows__gt=1)
+        .values_list('post_id', 'kind', 'last')
+    )
+    for post_id, kind, last in duplicated:
+        count, _ = PostChange.objects.filter(post_id=post_id, kind=kind, id__lt=last).delete()
+        removed += count
+    return removed
+
+
+# --- Tokens ---
+
+def encode_token(change_id):
+    payload = json.dumps({'c': change_id, 't': int(time.time())}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Returns (change id, issued at) for a sync token.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return int(data['c']), int(data['t'])
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise ValidationError({'since': 'Invalid token.'})
+
+
+def current_position():
+    return PostChange.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def is_expired(issued_at):
+    return issued_at < time.time() - retention().total_seconds()
+
+
+# --- Reading ---
+
+class ChangeSet:
+    def __init__(self, changed, counts, removed, position, has_more):
+        self.changed = changed    # ids of visible posts to re-render
+        self.counts = counts      # {id: (likes_count, comments_count)}
+        self.removed = removed    # ids deleted, hidden or deactivated
+        self.position = position
+        self.has_more = has_more
+
+
+def changes_since(position, limit):
+    """
+    The next `limit` log rows after `position`, resolved against the current
+    state of the posts.
+    """
+    rows = list(
+        PostChange.objects
+        .filter(id__gt=position)
+        .order_by('id')
+        .values_list('id', 'post_id', 'kind')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        position = rows[-1][0]
+
+    # Latest row per post wins, except that a counts row does not hide a full
+    # change in the same batch
+    kinds = {}
+    for _, post_id, kind in rows:
+        if not (kind == PostChange.COUNTS and kinds.get(post_id) == PostChange.POST):
+            kinds[post_id] = kind
+    alive = [post_id for post_id, kind in kinds.items() if kind != PostChange.DELETE]
+    visible = {
+        pk: (likes_count, comments_count)
+        for pk, likes_count, comments_count in Post.objects
+        .filter(pk__in=alive, is_active=True, is_show=True)
+        .values_list('id', 'likes_count', 'comments_count')
+    }
+    changed, counts, removed = [], {}, []
+    for post_id, kind in kinds.items():
+        if post_id not in visible:
+            removed.append(post_id)
+        elif kind == PostChange.COUNTS:
+            counts[post_id] = visible[post_id]
+        else:
+            changed.append(post_id)
+    return ChangeSet(changed, counts, removed, position, has_more)
+
+
+# --- Signals ---
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, **kwargs):
+    record([instance.pk], PostChange.POST)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    record([instance.pk], PostChange.DELETE)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # The body embeds the comment count and the latest comments
+    record([instance.post_id], PostChange.POST)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        record([instance.pk], PostChange.COUNTS)
+    elif action == 'pre_clear':
+        record(instance.liked_posts.values_list('pk', flat=True), PostChange.COUNTS)
+    else:
+        record(pk_set, PostChange.COUNTS)
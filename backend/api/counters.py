@@ -0,0 +1,84 @@
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+
+# Recomputes the denormalized counters on Post and Profile from the source
+# tables. Takes the model classes as arguments.
+
+def bump(model, pk, **deltas):
+    """
+    Atomically adds `deltas` to counter columns of one row, e.g.
+    bump(Post, post.pk, likes_count=1). Never goes below zero.
+    """
+    updates = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+    model.objects.filter(pk=pk).update(**updates)
+
+
+def bump_many(model, field, deltas):
+    """
+    bump() for several rows in one UPDATE: `deltas` maps pk -> delta for the
+    counter column `field`.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    change = Case(*[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()], default=Value(0))
+    model.objects.filter(pk__in=deltas).update(**{field: Greatest(F(field) + change, 0)})
+
+
+def _count(model, column):
+    rows = (
+        model.objects
+        .filter(**{column: OuterRef('pk')})
+        .order_by()
+        .values(column)
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def post_counts(Post, Comment):
+    return {
+        'likes_count': _count(Post.likes.through, 'post'),
+        'comments_count': _count(Comment, 'post'),
+    }
+
+
+def profile_counts(Profile):
+    # Profile.followers is a non-symmetrical self M2M: `X.followers` are the rows
+    # with from_profile=X, and `X.following` the rows with to_profile=X
+    through = Profile.followers.through
+    return {
+        'followers_count': _count(through, 'from_profile'),
+        'following_count': _count(through, 'to_profile'),
+    }
+
+
+def _pk_ranges(queryset, batch_size):
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last_pk = pks[-1]
+
+
+def repair(model, counts, batch_size=1000, dry_run=False):
+    """
+    Rewrites counters that drifted from `counts` (a post_counts/profile_counts
+    mapping), one primary-key range at a time. Returns the number of rows fixed.
+    """
+    aliases = {f'actual_{field}': expression for field, expression in counts.items()}
+    mismatch = Q()
+    for field in counts:
+        mismatch |= ~Q(**{field: F(f'actual_{field}')})
+    fixed = 0
+    for low, high in _pk_ranges(model.objects.all(), batch_size):
+        rows = model.objects.filter(pk__gte=low, pk__lte=high).alias(**aliases)
+        drifted = list(rows.filter(mismatch).values_list('pk', flat=True))
+        if drifted and not dry_run:
+            model.objects.filter(pk__in=drifted).update(**counts)
+        fixed += len(drifted)
+    return fixed
@@ -0,0 +1,166 @@
+import json
+import zlib
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .flat import COMMENT_FIELDS, POST_FIELDS, build_item, columns_for, render_datetime
+from .images import image_url
+from .models import Post, Comment, Profile
+from .renderers import orjson
+
+
+# NDJSON export of posts, comments and profiles (/api/export/<kind>/ and
+# `manage.py export_data`). Rows are read with .iterator(chunk_size), turned
+# into dicts by the api.flat builders (no model instances) and written one
+# chunk of lines at a time, optionally through a streaming gzip compressor,
+# so memory stays flat however many rows match.
+#
+# Filters: author (username), category (id), since / until (ISO date or
+# datetime, on created_at; on date_joined for profiles) and is_active (the
+# post's flag; the user's for profiles).
+
+CHUNK_SIZE = 2000
+
+POST_EXPORT_FIELDS = [
+    name for name in POST_FIELDS if name not in ('author_image', 'image_preview', 'is_liked', 'comments')
+]
+
+COMMENT_EXPORT_FIELDS = {
+    **COMMENT_FIELDS,
+    'post': (['post_id'], lambda row: row['post_id']),
+    'user_id': (['user_id'], lambda row: row['user_id']),
+}
+
+PROFILE_EXPORT_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'user_id': (['user_id'], lambda row: row['user_id']),
+    'username': (['user__username'], lambda row: row['user__username']),
+    'first_name': (['user__first_name'], lambda row: row['user__first_name']),
+    'last_name': (['user__last_name'], lambda row: row['user__last_name']),
+    'email': (['user__email'], lambda row: row['user__email']),
+    'is_active': (['user__is_active'], lambda row: row['user__is_active']),
+    'date_joined': (['user__date_joined'], lambda row: render_datetime(row['user__date_joined'])),
+    'bio': (['bio'], lambda row: row['bio']),
+    'profile_image': (['profile_image_id'], lambda row: image_url(row['profile_image_id'])),
+    'background_image': (['background_image_id'], lambda row: image_url(row['background_image_id'])),
+    'followers_count': (['followers_count'], lambda row: row['followers_count']),
+    'following_count': (['following_count'], lambda row: row['following_count']),
+}
+
+# kind: (model, field spec, fields, {filter: lookup})
+KINDS = {
+    'posts': (Post, POST_FIELDS, POST_EXPORT_FIELDS, {
+        'author': 'author__username', 'category': 'category_id', 'created_at': 'created_at',
+        'is_active': 'is_active',
+    }),
+    'comments': (Comment, COMMENT_EXPORT_FIELDS, list(COMMENT_EXPORT_FIELDS), {
+        'author': 'user__username', 'category': 'post__category_id', 'created_at': 'created_at',
+        'is_active': 'post__is_active',
+    }),
+    'profiles': (Profile, PROFILE_EXPORT_FIELDS, list(PROFILE_EXPORT_FIELDS), {
+        'author': 'user__username', 'created_at': 'user__date_joined', 'is_active': 'user__is_active',
+    }),
+}
+
+BOOLEANS = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False}
+
+
+def _moment(value, name, end_of_day=False):
+    try:
+        moment = parse_datetime(value)
+        day = None if moment else parse_date(value)
+    except ValueError:
+        moment = day = None
+    if day is not None:
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if moment is None:
+        raise ValueError(f'{name} must be an ISO date or datetime.')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filters(params):
+    """
+    Validated filters from query parameters or command options (strings or
+    None). Raises ValueError with a message for the client.
+    """
+    filters = {}
+    if params.get('author'):
+        filters['author'] = params['author']
+    if params.get('category'):
+        try:
+            filters['category'] = int(params['category'])
+        except ValueError:
+            raise ValueError('category must be an integer.')
+    if params.get('since'):
+        filters['since'] = _moment(params['since'], 'since')
+    if params.get('until'):
+        # A bare date includes that whole day
+        filters['until'] = _moment(params['until'], 'until', end_of_day=True)
+    if params.get('is_active') not in (None, ''):
+        value = str(params['is_active']).lower()
+        if value not in BOOLEANS:
+            raise ValueError('is_active must be true or false.')
+        filters['is_active'] = BOOLEANS[value]
+    return filters
+
+
+def export_query(kind, filters):
+    """
+    The .values() query for `kind` with `filters` applied, in primary key order.
+    """
+    model, spec, fields, lookups = KINDS[kind]
+    conditions = {}
+    for name, value in filters.items():
+        if name == 'since':
+            conditions[f'{lookups["created_at"]}__gte'] = value
+        elif name == 'until':
+            conditions[f'{lookups["created_at"]}__lte'] = value
+        elif name in lookups:
+            conditions[lookups[name]] = value
+        else:
+            raise ValueError(f'{name} does not apply to {kind}.')
+    return model.objects.filter(**conditions).order_by('pk').values(*columns_for(spec, fields))
+
+
+def _dumps(item):
+    if orjson is not None:
+        return orjson.dumps(item) + b'\n'
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def export_lines(kind, filters, chunk_size=CHUNK_SIZE):
+    """
+    The export as an iterator of bytes, one chunk of NDJSON lines per
+    chunk_size rows. Bad filters raise ValueError here, before anything is
+    streamed.
+    """
+    _, spec, fields, _ = KINDS[kind]
+    query = export_query(kind, filters)
+
+    def chunks():
+        lines = []
+        for row in query.iterator(chunk_size=chunk_size):
+            lines.append(_dumps(build_item(spec, fields, row)))
+            if len(lines) == chunk_size:
+                yield b''.join(lines)
+                lines = []
+        if lines:
+            yield b''.join(lines)
+
+    return chunks()
+
+
+def gzipped(chunks):
+    """
+    Compresses a stream of byte chunks into one gzip stream as it goes.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
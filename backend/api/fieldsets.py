@@ -0,0 +1,75 @@
+from rest_framework.exceptions import ValidationError
+
+
+# Sparse fieldsets: ?fields=a,b,c / ?omit=x,y on the read endpoints.
+# Both take field names or preset names; a preset expands to its fields.
+# Serializers declare `presets` (smallest first), and 'full' is always every
+# field in Meta.fields. The selected names are handed to the serializer as
+# `fields=`, which drops the rest before rendering, so a skipped
+# SerializerMethodField is never called and its query never runs.
+
+FULL = 'full'
+
+
+def presets_of(serializer_class):
+    """
+    {preset name: field names} of a serializer, smallest first, ending with 'full'.
+    """
+    presets = dict(getattr(serializer_class, 'presets', {}))
+    presets[FULL] = list(serializer_class.Meta.fields)
+    return presets
+
+
+def _expand(serializer_class, param, raw):
+    presets = presets_of(serializer_class)
+    names = []
+    for name in (part.strip() for part in raw.split(',')):
+        if not name:
+            continue
+        if name in presets:
+            names += presets[name]
+        elif name in presets[FULL]:
+            names.append(name)
+        else:
+            raise ValidationError({param: f'Unknown field or preset "{name}".'})
+    return set(names)
+
+
+def requested_fields(request, serializer_class, prefix=''):
+    """
+    The field names selected by ?<prefix>fields= and ?<prefix>omit=, in
+    serializer order, or None when every field is wanted.
+    """
+    fields_param, omit_param = f'{prefix}fields', f'{prefix}omit'
+    raw_fields = request.query_params.get(fields_param)
+    raw_omit = request.query_params.get(omit_param)
+    if not raw_fields and not raw_omit:
+        return None
+    all_fields = presets_of(serializer_class)[FULL]
+    selected = _expand(serializer_class, fields_param, raw_fields) if raw_fields else set(all_fields)
+    if raw_omit:
+        selected -= _expand(serializer_class, omit_param, raw_omit)
+    if selected == set(all_fields):
+        return None
+    return [name for name in all_fields if name in selected]
+
+
+def covering_preset(serializer_class, fields):
+    """
+    The smallest preset that contains every name in `fields` (None = all).
+    """
+    if fields is None:
+        return FULL
+    for name, preset_fields in presets_of(serializer_class).items():
+        if set(fields) <= set(preset_fields):
+            return name
+    return FULL
+
+
+def select(data, fields):
+    """
+    Keeps only `fields` of a rendered item (None keeps everything).
+    """
+    if fields is None:
+        return data
+    return {name: data[name] for name in fields if name in data}
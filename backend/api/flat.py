@@ -0,0 +1,158 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .images import image_url
+from .models import Post, Comment
+from .queries import comment_preview_size, latest_comment_ids
+
+
+# Flat rendering of post bodies for the hot list endpoints.
+# Builds the same dicts as PostSerializer(fields=...) without a request, but
+# straight from .values() rows: no model instances, no related-object
+# descriptors and no per-field to_representation dispatch. Enabled by
+# API_FAST_RENDERING; FlatRenderingTests keeps it in step with the serializer.
+
+_datetime_field = serializers.DateTimeField()
+
+# Builders return SKIP for keys the serializer leaves out, e.g. `category_name`
+# (source='category.name') when a post has no category
+SKIP = object()
+
+
+def render_datetime(value):
+    """
+    `value` as DateTimeField renders it (format and time zone settings).
+    """
+    return _datetime_field.to_representation(value)
+
+
+def _created_at(row):
+    return render_datetime(row['created_at'])
+
+
+def _updated_at(row):
+    return render_datetime(row['updated_at'])
+
+
+# field name: (columns needed from .values(), builder)
+POST_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'title': (['title'], lambda row: row['title']),
+    'content': (['content'], lambda row: row['content']),
+    'author': (['author__username'], lambda row: row['author__username']),
+    'author_id': (['author_id'], lambda row: row['author_id']),
+    'author_image': (
+        ['author__profile__profile_image_id'],
+        lambda row: image_url(row['author__profile__profile_image_id'], variant='avatar64'),
+    ),
+    'category': (['category_id'], lambda row: row['category_id']),
+    'category_name': (
+        ['category_id', 'category__name'],
+        lambda row: SKIP if row['category_id'] is None else row['category__name'],
+    ),
+    'created_at': (['created_at'], _created_at),
+    'updated_at': (['updated_at'], _updated_at),
+    'is_show': (['is_show'], lambda row: row['is_show']),
+    'is_active': (['is_active'], lambda row: row['is_active']),
+    'image': (['image_id'], lambda row: image_url(row['image_id'])),
+    'image_preview': (['image_id'], lambda row: image_url(row['image_id'], variant='preview')),
+    'likes_count': (['likes_count'], lambda row: row['likes_count']),
+    'comments_count': (['comments_count'], lambda row: row['comments_count']),
+    # Viewer state is patched in per request (see api.cache)
+    'is_liked': ([], lambda row: False),
+    'comments': (['id'], lambda row: row['comments']),
+}
+
+COMMENT_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'user': (['user__username'], lambda row: row['user__username']),
+    'user_image': (
+        ['user__profile__profile_image_id'],
+        lambda row: image_url(row['user__profile__profile_image_id'], variant='avatar64'),
+    ),
+    'content': (['content'], lambda row: row['content']),
+    'created_at': (['created_at'], _created_at),
+}
+
+
+def columns_for(spec, fields):
+    """
+    The .values() columns needed to build `fields` of `spec` (POST_FIELDS, ...).
+    """
+    columns = []
+    for name in fields:
+        for column in spec[name][0]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def build_item(spec, fields, row):
+    """
+    The dict of `fields` of `spec` for a .values() row from columns_for().
+    """
+    item = {}
+    for name in fields:
+        value = spec[name][1](row)
+        if value is not SKIP:
+            item[name] = value
+    return item
+
+
+def _latest_comment_query(post_ids):
+    size = comment_preview_size()
+    if not post_ids or size <= 0:
+        return None
+    columns = columns_for(COMMENT_FIELDS, COMMENT_FIELDS) + ['post_id']
+    return Comment.objects.filter(id__in=latest_comment_ids(post_ids, size)).values(*columns)
+
+
+def _group_comments(rows):
+    by_post = defaultdict(list)
+    for row in sorted(rows, key=lambda row: (row['created_at'], row['id'])):
+        by_post[row['post_id']].append(build_item(COMMENT_FIELDS, COMMENT_FIELDS, row))
+    return by_post
+
+
+def latest_comment_rows(post_ids):
+    """
+    {post id: [comment dict, ...]} with each post's comment preview, oldest first.
+    """
+    query = _latest_comment_query(post_ids)
+    return _group_comments(query if query is not None else [])
+
+
+async def alatest_comment_rows(post_ids):
+    query = _latest_comment_query(post_ids)
+    return _group_comments([row async for row in query] if query is not None else [])
+
+
+def _post_query(post_ids, fields):
+    return Post.objects.filter(pk__in=post_ids).values(*columns_for(POST_FIELDS, fields))
+
+
+def _assemble(rows, comments, fields):
+    if comments is not None:
+        for row in rows:
+            row['comments'] = comments.get(row['id'], [])
+    return [build_item(POST_FIELDS, fields, row) for row in rows]
+
+
+def post_rows(post_ids, fields):
+    """
+    What PostSerializer(posts, many=True, fields=fields).data holds for the
+    given posts (without a request), as plain dicts.
+    """
+    rows = list(_post_query(post_ids, fields))
+    comments = latest_comment_rows([row['id'] for row in rows]) if 'comments' in fields else None
+    return _assemble(rows, comments, fields)
+
+
+async def apost_rows(post_ids, fields):
+    """
+    post_rows() on the async ORM.
+    """
+    rows = [row async for row in _post_query(post_ids, fields).aiterator()]
+    comments = await alatest_comment_rows([row['id'] for row in rows]) if 'comments' in fields else None
+    return _assemble(rows, comments, fields)
@@ -0,0 +1,152 @@
+import base64
+import binascii
+import hashlib
+import io
+import re
+
+from django.conf import settings
+from django.urls import reverse
+
+from .storage import get_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it every variant is the original
+    Image = None
+
+
+# Uploads arrive as base64 data URLs ("data:image/png;base64,...."). They are
+# decoded once on write, stored by content hash and from then on referenced by
+# key; the API hands out URLs to the cacheable image endpoint instead.
+
+class InvalidImage(ValueError):
+    pass
+
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+URL_KEY_RE = re.compile(r'/images/([0-9a-f]{64})/(?:[a-z0-9]+/)?$')
+
+# Size variants: name -> (width, height, crop to exactly that box).
+# "full" is the original blob. Variant files are derived from the blob key, so
+# they are as immutable as the original; change the name if a spec changes.
+VARIANTS = {
+    'avatar64': (64, 64, True),
+    'preview': (640, 640, False),
+}
+FULL = 'full'
+
+
+def sniff_content_type(data):
+    for signature, content_type in SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def decode_image(value):
+    """
+    Decodes a base64 string or data URL. Returns (bytes, content_type).
+    """
+    if ',' in value and value.startswith('data:'):
+        value = value.split(',', 1)[1]
+    try:
+        data = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        raise InvalidImage('Image is not valid base64.')
+    if len(data) > getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024):
+        raise InvalidImage('Image is too large.')
+    # Trust the bytes, not the data URL header
+    content_type = sniff_content_type(data)
+    if content_type is None:
+        raise InvalidImage('Unsupported image format.')
+    return data, content_type
+
+
+def write_blob(data):
+    """
+    Writes `data` to the blob storage. Returns its content key.
+    """
+    key = hashlib.sha256(data).hexdigest()
+    get_storage().save(key, data)
+    return key
+
+
+def store_image(data, content_type):
+    """
+    Stores image bytes and returns the ImageBlob, reusing an existing blob with
+    the same content.
+    """
+    from .models import ImageBlob
+
+    key = write_blob(data)
+    blob, _ = ImageBlob.objects.get_or_create(
+        key=key, defaults={'content_type': content_type, 'size': len(data)}
+    )
+    return blob
+
+
+def render_variant(data, name):
+    width, height, crop = VARIANTS[name]
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if crop:
+            img = ImageOps.fit(img, (width, height), Image.LANCZOS)
+        else:
+            img.thumbnail((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img.convert('RGBA').save(out, 'PNG', optimize=True)
+        else:
+            img.convert('RGB').save(out, 'JPEG', quality=85, optimize=True)
+    return out.getvalue()
+
+
+def variant_key(key, name):
+    """
+    Returns the storage key holding variant `name` of blob `key`, generating and
+    caching it on first use. Falls back to the original when Pillow is missing
+    or cannot read the image.
+    """
+    if name == FULL or Image is None:
+        return key
+    storage = get_storage()
+    derived = f'{key}.{name}'
+    if storage.exists(derived):
+        return derived
+    try:
+        data = render_variant(storage.read(key), name)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return key
+    storage.save(derived, data)
+    return derived
+
+
+def generate_variants(key, names):
+    for name in names:
+        variant_key(key, name)
+
+
+def key_from_url(value):
+    match = URL_KEY_RE.search(value)
+    return match.group(1) if match else None
+
+
+def image_url(key, request=None, variant=FULL):
+    if not key:
+        return None
+    if variant == FULL:
+        url = reverse('get_image', args=[key])
+    else:
+        url = reverse('get_image_variant', args=[key, variant])
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
@@ -0,0 +1,154 @@
+import logging
+import traceback
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+# Background jobs for the slow side effects of writes (image variants, search
+# indexing, timeline backfills). Tasks are plain functions registered with
+# @task (see api.tasks); enqueue() hands one to the JOBS_BACKEND:
+#
+# - DatabaseBackend inserts a Job row in the caller's transaction, so a job
+#   only becomes visible with the write that queued it. `manage.py run_jobs`
+#   claims due rows with a compare-and-set UPDATE and runs them on a thread
+#   pool; a failing job is retried with exponential backoff up to
+#   JOBS_MAX_ATTEMPTS times and then left as FAILED.
+# - LocalBackend runs the task right away in the calling thread. The test
+#   runner (api.test_runner) switches to it, the way Django swaps in the
+#   locmem email backend.
+#
+# An idempotency key collapses repeated requests for the same work: while a
+# job with that key is still queued, enqueuing it again is a no-op. Tasks
+# must therefore be safe to run more than once.
+
+log = logging.getLogger('api.jobs')
+
+TASKS = {}
+
+
+def task(name):
+    """
+    Registers the decorated function as the task `name`. Payloads are JSON,
+    passed as keyword arguments.
+    """
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def max_attempts():
+    return getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'JOBS_RETRY_DELAY', 10) * 2 ** (attempts - 1))
+
+
+def run(name, payload):
+    TASKS[name](**payload)
+
+
+class LocalBackend:
+    def enqueue(self, name, payload, key=None):
+        run(name, payload)
+
+
+class DatabaseBackend:
+    def enqueue(self, name, payload, key=None):
+        # Conflict-tolerant insert: a queued job with the same key already covers it
+        Job.objects.bulk_create([Job(name=name, payload=payload, key=key)], ignore_conflicts=key is not None)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(getattr(settings, 'JOBS_BACKEND', 'api.jobs.DatabaseBackend'))()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'JOBS_BACKEND':
+        get_backend.cache_clear()
+
+
+def enqueue(name, key=None, **payload):
+    """
+    Queues task `name` with `payload`. See the idempotency note above for `key`.
+    """
+    if name not in TASKS:
+        raise KeyError(f'Unknown task {name!r}')
+    get_backend().enqueue(name, payload, key)
+
+
+# --- Worker (DatabaseBackend) ---
+
+def claim(limit, now=None):
+    """
+    Marks up to `limit` due jobs as running and returns them. Safe to call
+    from several workers: a job goes to whoever flips its status first.
+    """
+    now = now or timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    claimed = []
+    for pk in due.values_list('pk', flat=True)[:limit]:
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, locked_at=now,
+        ):
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def requeue(job, **fields):
+    """
+    Puts a claimed job back in the queue, or drops it when an identical job
+    was queued in the meantime.
+    """
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, locked_at=None, **fields)
+    except IntegrityError:
+        job.delete()
+
+
+def execute(job):
+    """
+    Runs a claimed job: deletes it on success, schedules a retry or marks it
+    failed otherwise. Returns True on success.
+    """
+    try:
+        with transaction.atomic():
+            run(job.name, job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= max_attempts():
+            log.error('Job %s %s failed for good after %d attempts:\n%s', job.pk, job.name, job.attempts, error)
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, locked_at=None, last_error=error)
+        else:
+            log.warning('Job %s %s failed (attempt %d), retrying:\n%s', job.pk, job.name, job.attempts, error)
+            requeue(job, run_at=timezone.now() + retry_delay(job.attempts), last_error=error)
+        return False
+    job.delete()
+    return True
+
+
+def requeue_stale(older_than, now=None):
+    """
+    Requeues jobs left running by a worker that died. Returns how many.
+    """
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - older_than)
+    count = 0
+    for job in stale:
+        requeue(job)
+        count += 1
+    return count
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.timeline import backfill, fanout_limit, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Backfills home timelines from follows (one user, one follow, or everyone)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username whose timeline is backfilled')
+        parser.add_argument('--author', help='Only backfill posts by this followed username')
+        parser.add_argument('--all', action='store_true', help='Rebuild every user\'s timeline')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            count = 0
+            for user_id in User.objects.values_list('id', flat=True).iterator(chunk_size=1000):
+                rebuild(user_id)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} timeline(s)'))
+            return
+
+        if not options['user']:
+            raise CommandError('Pass --user (optionally with --author) or --all')
+        user = self.get_user(options['user'])
+        if options['author']:
+            author = self.get_user(options['author'])
+            if author.profile.followers_count > fanout_limit():
+                self.stdout.write(f'{author.username} is merged in on read; nothing to backfill')
+                return
+            backfill(user.id, author.id)
+            self.stdout.write(self.style.SUCCESS(f'Backfilled {author.username} into {user.username}\'s timeline'))
+        else:
+            rebuild(user.id)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {user.username}\'s timeline'))
+
+    def get_user(self, username):
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'No user named "{username}"')
@@ -0,0 +1,247 @@
+import json
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api import urls
+from api.changes import current_position, encode_token, record
+from api.metrics import metrics
+from api.models import Post, PostChange, ImageBlob
+from api.seed import seed
+
+
+# How to call each named route in api.urls: spec(context, iteration) returns
+# (method, path, data, extra headers). Specs run outside the timed part, so
+# they can set things up (a post to delete, a refresh token to log out).
+
+def _get(name, **kwargs):
+    return lambda ctx, i: ('get', reverse(name, kwargs={k: getattr(ctx, v) for k, v in kwargs.items()}), None, {})
+
+
+def _delete_post(ctx, i):
+    post = Post.objects.create(author=ctx.viewer, title='Delete me', content='Soon gone')
+    return 'delete', reverse('delete_post', kwargs={'pk': post.pk}), None, {}
+
+
+SPECS = {
+    'get_posts': _get('get_posts'),
+    'get_post_changes': lambda ctx, i: ('get', f'{reverse("get_post_changes")}?since={ctx.since}', None, {}),
+    'get_trending': _get('get_trending'),
+    'get_timeline': _get('get_timeline'),
+    'search_posts': lambda ctx, i: ('get', f'{reverse("search_posts")}?q=django', None, {}),
+    'create_post': lambda ctx, i: (
+        'post', reverse('create_post'), {'title': f'Benchmark {i}', 'content': 'Lorem ipsum ' * 50}, {}
+    ),
+    'batch_create_posts': lambda ctx, i: (
+        'post', reverse('batch_create_posts'),
+        {'items': [{'title': f'Batch {i}.{j}', 'content': 'Lorem ipsum ' * 50} for j in range(10)]}, {},
+    ),
+    'batch_add_comments': lambda ctx, i: (
+        'post', reverse('batch_add_comments'),
+        {'items': [{'post': post_id, 'content': f'Comment {i}'} for post_id in ctx.post_ids[:10]]}, {},
+    ),
+    'batch_set_likes': lambda ctx, i: (
+        'post', reverse('batch_set_likes'),
+        {'items': [{'post': post_id, 'liked': i % 2 == 0} for post_id in ctx.post_ids[:10]]}, {},
+    ),
+    'auth_logout': lambda ctx, i: (
+        'post', reverse('auth_logout'), {'refresh_token': str(RefreshToken.for_user(ctx.viewer))}, {}
+    ),
+    'get_user_profile': _get('get_user_profile'),
+    'auth_register': lambda ctx, i: (
+        'post', reverse('auth_register'),
+        {'username': f'bench-register-{i}', 'password': 'correct-horse-battery', 'email': f'bench{i}@example.com'},
+        {},
+    ),
+    'get_my_posts': _get('get_my_posts'),
+    'update_post': lambda ctx, i: (
+        'put', reverse('update_post', kwargs={'pk': ctx.own_post}), {'title': f'Edited {i}'}, {}
+    ),
+    'delete_post': _delete_post,
+    'get_image': _get('get_image', key='image'),
+    'get_image_variant': lambda ctx, i: (
+        'get', reverse('get_image_variant', kwargs={'key': ctx.image, 'variant': 'preview'}), None, {}
+    ),
+    'get_categories': _get('get_categories'),
+    'export_data': lambda ctx, i: ('get', reverse('export_data', kwargs={'kind': 'posts'}), None, {}),
+    'get_cache_stats': _get('get_cache_stats'),
+    'get_metrics': lambda ctx, i: ('get', reverse('get_metrics'), None, {'HTTP_AUTHORIZATION': 'Bearer benchmark'}),
+    'get_comments': _get('get_comments', post_id='post'),
+    'add_comment': lambda ctx, i: (
+        'post', reverse('add_comment', kwargs={'post_id': ctx.post}), {'content': f'Comment {i}'}, {}
+    ),
+    'toggle_like': lambda ctx, i: ('post', reverse('toggle_like', kwargs={'post_id': ctx.post}), None, {}),
+    'update_profile': lambda ctx, i: ('put', reverse('update_profile'), {'bio': f'Bio {i}'}, {}),
+    'get_profile': _get('get_profile', username='other'),
+    'toggle_follow': lambda ctx, i: ('post', reverse('toggle_follow', kwargs={'username': ctx.other}), None, {}),
+}
+
+# Requests per round for the slow ones (password hashing)
+MAX_REPEAT = {'auth_register': 3}
+
+
+class Context:
+    """
+    The seeded objects the specs point at. The viewer is staff so the admin
+    endpoints answer too.
+    """
+
+    def __init__(self, prefix):
+        self.viewer = User.objects.get(username=f'{prefix}0')
+        self.viewer.is_staff = True
+        self.viewer.save(update_fields=['is_staff'])
+        self.other = f'{prefix}1'
+        posts = Post.objects.filter(is_show=True).exclude(author=self.viewer).order_by('-likes_count', 'pk')
+        self.post_ids = list(posts.values_list('pk', flat=True)[:20])
+        self.post = self.post_ids[0]
+        self.own_post = Post.objects.create(author=self.viewer, title='Mine', content='Lorem ipsum ' * 50).pk
+        self.image = ImageBlob.objects.values_list('pk', flat=True).first()
+        # A delta sync over a page worth of changes
+        self.since = encode_token(current_position())
+        record(self.post_ids, PostChange.POST)
+
+
+def percentile(timings, n):
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[n - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway test database at each size and times every route in api.urls through the '
+        'test client: latency percentiles, SQL queries and response size, optionally against a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help='Comma-separated post counts to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint')
+        parser.add_argument('--cold', action='store_true', help='Clear the caches before every request')
+        parser.add_argument('--only', default='', help='Comma-separated route names')
+        parser.add_argument('--baseline', help='Compare against this JSON file')
+        parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown (0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers.')
+        only = {name for name in options['only'].split(',') if name}
+        names = []
+        for pattern in urls.urlpatterns:
+            if pattern.name not in SPECS:
+                self.stderr.write(self.style.WARNING(f'No benchmark spec for {pattern.name or pattern.pattern}, skipped'))
+            elif not only or pattern.name in only:
+                names.append(pattern.name)
+
+        results = {}
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+        try:
+            with tempfile.TemporaryDirectory(prefix='benchmark-api-') as directory, override_settings(
+                IMAGE_STORAGE={'BACKEND': 'api.storage.LocalBlobStorage', 'OPTIONS': {'location': directory}},
+                API_METRICS_TOKEN='benchmark',
+                # The results table says it all
+                API_SLOW_REQUEST_MS=float('inf'),
+            ):
+                for size in sizes:
+                    results[str(size)] = self.run(size, names, options)
+                    call_command('flush', interactive=False, verbosity=0)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        baseline = None
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+        regressions = self.report(results, baseline, options['tolerance'])
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Saved baseline to {options["save_baseline"]}')
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{regressions} regression(s) against {options["baseline"]}')
+
+    def run(self, size, names, options):
+        for cache in caches.all():
+            cache.clear()
+        metrics.reset()
+        prefix = f'bench{size}-'
+        start = time.perf_counter()
+        seed(users=max(10, size // 10), posts=size, prefix=prefix)
+        self.stdout.write(f'Seeded {size} posts in {time.perf_counter() - start:.1f}s')
+        ctx = Context(prefix)
+        client = APIClient()
+        token = f'Bearer {AccessToken.for_user(ctx.viewer)}'
+        return {name: self.measure(client, token, ctx, name, options) for name in names}
+
+    def measure(self, client, token, ctx, name, options):
+        repeat = min(options['repeat'], MAX_REPEAT.get(name, options['repeat']))
+        warmup = min(options['warmup'], MAX_REPEAT.get(name, options['warmup']))
+        timings, queries, size, statuses = [], 0, 0, set()
+        for i in range(warmup + repeat):
+            method, path, data, headers = SPECS[name](ctx, i)
+            if options['cold']:
+                for cache in caches.all():
+                    cache.clear()
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                start = time.perf_counter()
+                response = getattr(client, method)(path, data, format='json', **{'HTTP_AUTHORIZATION': token, **headers})
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            timings.append(elapsed * 1000)
+            queries = max(queries, sum(len(capture) for capture in captured))
+            size = len(body)
+            statuses.add(response.status_code)
+        if any(code >= 400 for code in statuses):
+            self.stderr.write(self.style.WARNING(f'{name} answered {sorted(statuses)}'))
+        return {
+            'p50': percentile(timings, 50), 'p95': percentile(timings, 95), 'p99': percentile(timings, 99),
+            'queries': queries, 'bytes': size, 'status': sorted(statuses),
+        }
+
+    def report(self, results, baseline, tolerance):
+        regressions = 0
+        for size, rows in results.items():
+            self.stdout.write(f'\n{size} posts')
+            self.stdout.write(f'{"endpoint":<22}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"bytes":>9}')
+            for name, row in rows.items():
+                line = (
+                    f'{name:<22}{row["p50"]:9.2f}{row["p95"]:9.2f}{row["p99"]:9.2f}'
+                    f'{row["queries"]:9}{row["bytes"]:9}'
+                )
+                before = (baseline or {}).get(size, {}).get(name)
+                if before is None:
+                    self.stdout.write(line)
+                    continue
+                slower = row['p50'] > before['p50'] * (1 + tolerance)
+                more_queries = row['queries'] > before['queries']
+                change = f'  p50 {(row["p50"] / before["p50"] - 1) * 100:+.0f}%' if before['p50'] else ''
+                if more_queries:
+                    change += f'  queries {before["queries"]} -> {row["queries"]}'
+                if slower or more_queries:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(line + change))
+                else:
+                    self.stdout.write(line + change)
+        return regressions
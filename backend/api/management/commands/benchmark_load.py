@@ -0,0 +1,76 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+DEFAULT_PATHS = ['/api/posts/', '/api/profile/', '/api/categories/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests read endpoints of a running server and reports requests/sec and latency percentiles. '
+        'Compare deployments at the same worker count, e.g. '
+        '"gunicorn backend.wsgi -w 4 --threads 8" (WSGI, sync DRF views) vs '
+        '"gunicorn backend.asgi -w 4 -k uvicorn.workers.UvicornWorker" (ASGI; add API_ASYNC_VIEWS=1 for api.async_views)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--user', required=True, help='Username to mint an access token for')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f'Path to request, repeatable (default: {" ".join(DEFAULT_PATHS)} and the '
+                                 'user\'s /api/profile/<username>/)')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per path')
+        parser.add_argument('--warmup', type=int, default=50, help='Untimed requests per path first')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user "{options["user"]}"')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}', 'Accept': 'application/json'}
+        paths = options['paths'] or DEFAULT_PATHS + [f'/api/profile/{user.username}/']
+        target = urlsplit(options['url'])
+
+        # One keep-alive connection per client thread
+        local = threading.local()
+
+        def fetch(path):
+            if getattr(local, 'conn', None) is None:
+                local.conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+            start = time.perf_counter()
+            try:
+                local.conn.request('GET', path, headers=headers)
+                response = local.conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                local.conn.close()
+                local.conn = None
+                return None
+            return time.perf_counter() - start, response.status
+
+        self.stdout.write(f'{options["url"]}, {options["concurrency"]} connections, {options["requests"]} requests per path')
+        self.stdout.write(f'{"path":<36}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            for path in paths:
+                list(pool.map(fetch, [path] * options['warmup']))
+                start = time.perf_counter()
+                results = list(pool.map(fetch, [path] * options['requests']))
+                elapsed = time.perf_counter() - start
+                latencies = sorted(result[0] for result in results if result and result[1] == 200)
+                errors = len(results) - len(latencies)
+                if len(latencies) < 2:
+                    self.stdout.write(self.style.ERROR(f'{path:<36}{"":>27}{errors:>8}'))
+                    continue
+                cuts = statistics.quantiles(latencies, n=100)
+                self.stdout.write(
+                    f'{path:<36}{len(latencies) / elapsed:9.0f}{cuts[49] * 1000:9.1f}{cuts[98] * 1000:9.1f}{errors:>8}'
+                )
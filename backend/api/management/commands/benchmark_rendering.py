@@ -0,0 +1,79 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fieldsets import presets_of
+from api.flat import post_rows
+from api.models import Post, Comment, Category
+from api.queries import attach_latest_comments, plan_posts
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import PostSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Times PostSerializer vs the flat path and JSONRenderer vs FastJSONRenderer on one page of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100, help='Posts per page')
+        parser.add_argument('--comments', type=int, default=10, help='Comments per post')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--number', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Synthetic rows, rolled back at the end
+        try:
+            with transaction.atomic():
+                post_ids = self.seed(options['posts'], options['comments'])
+                self.run(post_ids, options['repeat'], options['number'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, posts, comments):
+        authors = User.objects.bulk_create(User(username=f'bench-rendering-{i}') for i in range(10))
+        category = Category.objects.create(name='bench-rendering')
+        created = Post.objects.bulk_create(
+            Post(title=f'Post {i}', content='Lorem ipsum dolor sit amet. ' * 40, author=authors[i % 10],
+                 category=category, comments_count=comments)
+            for i in range(posts)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, user=authors[j % 10], content='Nice post! ' * 5)
+            for post in created for j in range(comments)
+        )
+        return [post.pk for post in created]
+
+    def time(self, label, func, repeat, number):
+        best = min(timeit.repeat(func, repeat=repeat, number=number)) / number
+        self.stdout.write(f'{label:<28}{best * 1000:9.2f} ms')
+        return best
+
+    def run(self, post_ids, repeat, number):
+        fields = presets_of(PostSerializer)['full']
+
+        def serializer():
+            posts = attach_latest_comments(plan_posts(Post.objects.filter(pk__in=post_ids), fields))
+            return PostSerializer(posts, many=True, fields=fields).data
+
+        def flat():
+            return post_rows(post_ids, fields)
+
+        self.stdout.write(f'Serializing {len(post_ids)} posts (including queries)')
+        slow = self.time('  PostSerializer', serializer, repeat, number)
+        fast = self.time('  flat .values() rows', flat, repeat, number)
+        self.stdout.write(self.style.SUCCESS(f'  {slow / fast:.1f}x faster'))
+
+        data = {'results': [dict(item) for item in serializer()], 'next': None, 'previous': None}
+        self.stdout.write(f'Rendering {len(JSONRenderer().render(data))} bytes of JSON')
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('  orjson is not installed; FastJSONRenderer falls back to JSONRenderer'))
+        slow = self.time('  JSONRenderer', lambda: JSONRenderer().render(data), repeat, number)
+        fast = self.time('  FastJSONRenderer', lambda: FastJSONRenderer().render(data), repeat, number)
+        self.stdout.write(self.style.SUCCESS(f'  {slow / fast:.1f}x faster'))
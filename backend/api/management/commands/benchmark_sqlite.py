@@ -0,0 +1,159 @@
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+
+SCHEMA = [
+    'CREATE TABLE bench_post (id INTEGER PRIMARY KEY, likes_count INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE bench_like (post_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (post_id, user_id))',
+]
+
+FEED = '''
+    SELECT p.id, p.likes_count, (SELECT COUNT(*) FROM bench_like l WHERE l.post_id = p.id)
+    FROM bench_post p ORDER BY p.likes_count DESC, p.id DESC LIMIT 20
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammers a scratch SQLite file with concurrent like/unlike writers and feed readers, '
+        'once with the default settings and once with DATABASE_PROFILE=production, and '
+        'reports throughput and "database is locked" errors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--posts', type=int, default=50)
+
+    def handle(self, *args, **options):
+        directory = Path(tempfile.mkdtemp(prefix='benchmark-sqlite-'))
+        try:
+            self.stdout.write(
+                f'{options["writers"]} writers, {options["readers"]} readers, {options["seconds"]:g}s per profile'
+            )
+            self.stdout.write(f'{"profile":<14}{"writes/s":>10}{"reads/s":>10}{"p99 write ms":>14}{"locked":>8}')
+            for profile in ('development', 'production'):
+                self.run(profile, directory / f'{profile}.sqlite3', options)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def aliases(self, profile, path):
+        # (write alias, read alias) on `path`, configured like settings.py does
+        write_alias, read_alias = f'bench-{profile}', f'bench-{profile}-read'
+        primary = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)}
+        databases = {write_alias: primary}
+        if profile == 'production':
+            primary['OPTIONS'] = settings.SQLITE_PRODUCTION_OPTIONS
+            databases[read_alias] = {
+                **primary,
+                'OPTIONS': {
+                    **settings.SQLITE_PRODUCTION_OPTIONS,
+                    'init_command': settings.SQLITE_PRODUCTION_OPTIONS['init_command'] + 'PRAGMA query_only=ON;',
+                    'transaction_mode': 'DEFERRED',
+                },
+            }
+        else:
+            read_alias = write_alias
+        configured = connections.configure_settings({DEFAULT_DB_ALIAS: {}, **databases})
+        for alias in databases:
+            connections.settings[alias] = configured[alias]
+        return write_alias, read_alias, list(databases)
+
+    def run(self, profile, path, options):
+        write_alias, read_alias, aliases = self.aliases(profile, path)
+        try:
+            with connections[write_alias].cursor() as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+                cursor.executemany('INSERT INTO bench_post (id) VALUES (%s)', [(i,) for i in range(options['posts'])])
+            connections[write_alias].close()
+
+            deadline = time.perf_counter() + options['seconds']
+            lock = threading.Lock()
+            totals = {'writes': 0, 'reads': 0, 'locked': 0}
+            latencies = []
+
+            def write():
+                post_id = random.randrange(options['posts'])
+                user_id = random.randrange(1000)
+                liked = random.random() < 0.5
+                # The statements of api.relations.set_like: a conflict-tolerant
+                # INSERT (PUT) or a DELETE, and the counter moved only when a row changed
+                with transaction.atomic(using=write_alias), connections[write_alias].cursor() as cursor:
+                    if liked:
+                        cursor.execute(
+                            'INSERT INTO bench_like (post_id, user_id) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                            [post_id, user_id],
+                        )
+                    else:
+                        cursor.execute('DELETE FROM bench_like WHERE post_id = %s AND user_id = %s', [post_id, user_id])
+                    if cursor.rowcount == 1:
+                        delta = 1 if liked else -1
+                        cursor.execute(
+                            'UPDATE bench_post SET likes_count = CASE WHEN likes_count + %s < 0 THEN 0 '
+                            'ELSE likes_count + %s END WHERE id = %s RETURNING likes_count',
+                            [delta, delta, post_id],
+                        )
+                        cursor.fetchone()
+
+            def read():
+                with connections[read_alias].cursor() as cursor:
+                    cursor.execute(FEED)
+                    cursor.fetchall()
+
+            def worker(operation, kind):
+                done, locked, timings = 0, 0, []
+                try:
+                    while time.perf_counter() < deadline:
+                        start = time.perf_counter()
+                        try:
+                            operation()
+                        except OperationalError as e:
+                            if 'locked' not in str(e):
+                                raise
+                            locked += 1
+                            continue
+                        done += 1
+                        timings.append(time.perf_counter() - start)
+                finally:
+                    for alias in aliases:
+                        connections[alias].close()
+                with lock:
+                    totals[kind] += done
+                    totals['locked'] += locked
+                    if kind == 'writes':
+                        latencies.extend(timings)
+
+            threads = [threading.Thread(target=worker, args=(write, 'writes')) for _ in range(options['writers'])]
+            threads += [threading.Thread(target=worker, args=(read, 'reads')) for _ in range(options['readers'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            with connections[write_alias].cursor() as cursor:
+                cursor.execute('SELECT (SELECT SUM(likes_count) FROM bench_post) - (SELECT COUNT(*) FROM bench_like)')
+                drift = cursor.fetchone()[0]
+            p99 = statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else float('nan')
+            self.stdout.write(
+                f'{profile:<14}{totals["writes"] / elapsed:10.0f}{totals["reads"] / elapsed:10.0f}'
+                f'{p99:14.1f}{totals["locked"]:8}'
+            )
+            if drift:
+                self.stdout.write(self.style.ERROR(f'  likes_count is off by {drift}'))
+        finally:
+            for alias in aliases:
+                connections[alias].close()
+                del connections.settings[alias]
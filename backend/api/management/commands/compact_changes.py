@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.changes import compact
+
+
+class Command(BaseCommand):
+    help = 'Prunes expired delete tombstones and duplicate rows from the post change log'
+
+    def handle(self, *args, **options):
+        removed = compact()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} change log row(s)'))
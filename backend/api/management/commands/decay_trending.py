@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.trending import decay, recompute
+
+
+class Command(BaseCommand):
+    help = (
+        'Ages the trending scores by --hours; schedule it every that many hours. '
+        'With --recompute, rebuilds them from the likes and comments tables instead'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=1, help='Time since the previous run')
+        parser.add_argument('--recompute', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['recompute']:
+            scored = recompute(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Recomputed the trending scores of {scored} posts'))
+        else:
+            touched = decay(options['hours'])
+            self.stdout.write(self.style.SUCCESS(f'Decayed {touched} trending scores by {options["hours"]:g}h'))
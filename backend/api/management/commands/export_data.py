@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import CHUNK_SIZE, KINDS, export_lines, gzipped, parse_filters
+
+
+class Command(BaseCommand):
+    help = 'Writes posts, comments or profiles as NDJSON (optionally gzipped), streaming rows in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(KINDS))
+        parser.add_argument('--output', '-o', default='-', help='File to write, "-" for stdout')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--author', help='Username')
+        parser.add_argument('--category', help='Category id')
+        parser.add_argument('--since', help='ISO date or datetime')
+        parser.add_argument('--until', help='ISO date or datetime; a bare date includes the day')
+        parser.add_argument('--active', dest='is_active', action='store_const', const='true')
+        parser.add_argument('--inactive', dest='is_active', action='store_const', const='false')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export_lines(options['kind'], parse_filters(options), options['chunk_size'])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        if options['gzip']:
+            chunks = gzipped(chunks)
+
+        out = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is sys.stdout.buffer:
+                out.flush()
+            else:
+                out.close()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import post_counts, profile_counts, repair
+from api.models import Post, Profile, Comment
+
+
+class Command(BaseCommand):
+    help = 'Recomputes like/comment/follower counters and repairs rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        posts = repair(Post, post_counts(Post, Comment), batch_size, dry_run)
+        profiles = repair(Profile, profile_counts(Profile), batch_size, dry_run)
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {posts} post(s) and {profiles} profile(s) with drifted counters'))
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import claim, execute, requeue_stale
+
+
+def run_one(job):
+    try:
+        return execute(job)
+    finally:
+        # Worker threads are reused; drop their connections like a request would
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (api.jobs) on a thread pool until stopped, or until the queue is empty with --once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due')
+        parser.add_argument('--poll', type=float, default=1, help='Seconds between polls of an empty queue')
+        parser.add_argument(
+            '--stale-after', type=float, default=300,
+            help='Requeue jobs another worker has been running for this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        done = failed = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='job') as pool:
+            try:
+                while True:
+                    requeue_stale(stale_after)
+                    free = options['threads'] - len(running)
+                    jobs = claim(free) if free else []
+                    running |= {pool.submit(run_one, job) for job in jobs}
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+                    finished, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        if future.result():
+                            done += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping, waiting for running jobs')
+        self.stdout.write(self.style.SUCCESS(f'{done} jobs done, {failed} failed'))
@@ -0,0 +1,46 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seed import SEED_PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with synthetic users, profiles, follows, categories, posts (some with images), '
+        'comments and likes using bulk inserts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=5, help='Average comments per post')
+        parser.add_argument('--likes', type=int, default=10, help='Average likes per post')
+        parser.add_argument('--follows', type=int, default=10, help='Average users followed per user')
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--image-ratio', type=float, default=0.3, help='Share of posts and profiles with an image')
+        parser.add_argument('--days', type=int, default=30, help='Spread the posts over this many days')
+        parser.add_argument('--prefix', default='seed', help='Username prefix')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        if options['posts'] and options['users'] < 1:
+            raise CommandError('Posts need at least one user.')
+        if not 0 <= options['image_ratio'] <= 1:
+            raise CommandError('--image-ratio must be between 0 and 1.')
+        start = time.perf_counter()
+        try:
+            counts = seed(
+                users=options['users'], posts=options['posts'], comments=options['comments'],
+                likes=options['likes'], follows=options['follows'], categories=options['categories'],
+                image_ratio=options['image_ratio'], days=options['days'], prefix=options['prefix'],
+                rng=random.Random(options['seed']),
+            )
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        elapsed = time.perf_counter() - start
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {elapsed:.1f}s; log in as {options["prefix"]}0 / {SEED_PASSWORD}'
+        ))
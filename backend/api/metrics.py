@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Per-view request metrics, kept in memory and served in the Prometheus text
+# format at /api/metrics/.
+# MetricsMiddleware opens a Sample for every request in a context variable;
+# the query hook below (installed on every connection, the same hook
+# connection.execute_wrapper() uses) and FastJSONRenderer add to whatever
+# Sample is current. Context variables follow the request into
+# sync_to_async() threads, so async views are measured too.
+#
+# Requests slower than API_SLOW_REQUEST_MS are logged to "api.slow" with the
+# SQL they ran (statements only; parameters can hold user data).
+
+slow_log = logging.getLogger('api.slow')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'api_request_duration_seconds': ('Request latency', DURATION_BUCKETS),
+    'api_db_queries': ('SQL queries per request', QUERY_BUCKETS),
+    'api_db_duration_seconds': ('Time spent in SQL per request', DURATION_BUCKETS),
+    'api_serialize_duration_seconds': ('Time spent rendering the response body', DURATION_BUCKETS),
+    'api_response_bytes': ('Response body size', BYTES_BUCKETS),
+}
+
+# Queries kept per request for the slow-request log
+MAX_LOGGED_QUERIES = 200
+
+
+def slow_threshold():
+    return getattr(settings, 'API_SLOW_REQUEST_MS', 500) / 1000
+
+
+class Sample:
+    """
+    What one request spent.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.sql = []
+
+
+_current = ContextVar('api_metrics_sample', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        sample.queries += 1
+        sample.db_time += elapsed
+        if len(sample.sql) < MAX_LOGGED_QUERIES:
+            sample.sql.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Connections are reopened on the same wrapper object, so only add it once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure_serialization():
+    sample = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if sample is not None:
+            sample.serialize_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        # counts[i] holds the values in (buckets[i-1], buckets[i]]; the last one +Inf
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Thread-safe per-view histograms and request counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+    def observe(self, view, status, values):
+        """
+        `values` maps histogram name (see HISTOGRAMS) to this request's value.
+        """
+        with self._lock:
+            self._requests[view, status] = self._requests.get((view, status), 0) + 1
+            for name, value in values.items():
+                key = (name, view)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(HISTOGRAMS[name][1])
+                self._histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self, cache_stats=None):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = [
+                '# HELP api_requests_total Requests served',
+                '# TYPE api_requests_total counter',
+            ]
+            for (view, status), count in sorted(self._requests.items()):
+                lines.append(f'api_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (metric, view), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    view = _label(view)
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {total}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        if cache_stats is not None:
+            for kind in ('hits', 'misses'):
+                lines += [f'# HELP api_cache_{kind}_total Read cache {kind}', f'# TYPE api_cache_{kind}_total counter']
+                for namespace, counts in sorted(cache_stats.items()):
+                    lines.append(f'api_cache_{kind}_total{{namespace="{_label(namespace)}"}} {counts[kind]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """
+    Measures every request; goes first in MIDDLEWARE so the whole stack is timed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sample = Sample()
+        token = _current.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, sample)
+        return response
+
+    async def __acall__(self, request):
+        sample = Sample()
+        token = _current.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, sample)
+        return response
+
+    def finish(self, request, response, sample):
+        duration = time.perf_counter() - sample.start
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+        values = {
+            'api_request_duration_seconds': duration,
+            'api_db_queries': sample.queries,
+            'api_db_duration_seconds': sample.db_time,
+            'api_serialize_duration_seconds': sample.serialize_time,
+        }
+        if not response.streaming:
+            values['api_response_bytes'] = len(response.content)
+        metrics.observe(view, response.status_code, values)
+
+        if duration >= slow_threshold():
+            queries = '\n'.join(f'  {elapsed * 1000:8.2f} ms  {sql}' for elapsed, sql in sample.sql)
+            slow_log.warning(
+                'Slow request: %s %s (%s) %d in %.0f ms, %d queries in %.0f ms, rendering %.0f ms\n%s',
+                request.method, request.get_full_path(), view, response.status_code, duration * 1000,
+                sample.queries, sample.db_time * 1000, sample.serialize_time * 1000, queries,
+            )
@@ -0,0 +1,169 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+log = logging.getLogger('api.migrations')
+
+BATCH_SIZE = 200
+
+# (model, old base64 columns); each moves to a <column>_blob foreign key
+IMAGE_FIELDS = [
+    ('Post', ['image']),
+    ('Profile', ['profile_image', 'background_image']),
+]
+
+# Frozen copies of the decoding and the blob layout of api.images/api.storage
+# as they were when this migration was written, so later changes there cannot
+# change what it does. Blobs go to the IMAGE_STORAGE location, two levels of
+# fan-out deep (ab/cd/abcd...).
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def _decode(value):
+    # (bytes, content_type), or None for anything that is not a known image
+    if ',' in value and value.startswith('data:'):
+        value = value.split(',', 1)[1]
+    try:
+        data = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    if len(data) > getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024):
+        return None
+    for signature, content_type in SIGNATURES:
+        if data.startswith(signature):
+            return data, content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return data, 'image/webp'
+    return None
+
+
+def _blob_path(key):
+    location = str(settings.IMAGE_STORAGE['OPTIONS']['location'])
+    return os.path.join(location, key[:2], key[2:4], key)
+
+
+def _write_blob(data):
+    key = hashlib.sha256(data).hexdigest()
+    path = _blob_path(key)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(f'{path}.tmp', path)
+    return key
+
+
+def _batches(model, fields):
+    # Walk the table by primary key so only one batch is in memory at a time
+    last_pk = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *fields)[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1].pk
+
+
+def images_to_blobs(apps, schema_editor):
+    ImageBlob = apps.get_model('api', 'ImageBlob')
+    for model_name, fields in IMAGE_FIELDS:
+        model = apps.get_model('api', model_name)
+        blob_fields = [f'{field}_blob' for field in fields]
+        skipped = {field: [] for field in fields}
+        for rows in _batches(model, fields):
+            for row in rows:
+                for field in fields:
+                    key = None
+                    value = getattr(row, field)
+                    decoded = _decode(value) if value else None
+                    if decoded is not None:
+                        data, content_type = decoded
+                        key = _write_blob(data)
+                        ImageBlob.objects.get_or_create(
+                            key=key, defaults={'content_type': content_type, 'size': len(data)}
+                        )
+                    elif value:
+                        skipped[field].append(row.pk)
+                    setattr(row, f'{field}_blob_id', key)
+            model.objects.bulk_update(rows, blob_fields)
+        # The old columns are dropped next; say which values did not make it
+        for field, pks in skipped.items():
+            if pks:
+                log.warning(
+                    '%s.%s: dropping %d value(s) that are not a decodable image, pks: %s',
+                    model_name, field, len(pks), ', '.join(map(str, pks)),
+                )
+
+
+def blobs_to_images(apps, schema_editor):
+    ImageBlob = apps.get_model('api', 'ImageBlob')
+    for model_name, fields in IMAGE_FIELDS:
+        model = apps.get_model('api', model_name)
+        blob_fields = [f'{field}_blob' for field in fields]
+        for rows in _batches(model, blob_fields):
+            for row in rows:
+                for field in fields:
+                    value = None
+                    key = getattr(row, f'{field}_blob_id')
+                    if key and os.path.exists(_blob_path(key)):
+                        content_type = ImageBlob.objects.get(pk=key).content_type
+                        with open(_blob_path(key), 'rb') as f:
+                            encoded = base64.b64encode(f.read()).decode()
+                        value = f'data:{content_type};base64,{encoded}'
+                    setattr(row, field, value)
+            model.objects.bulk_update(rows, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_post_category_post_likes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('content_type', models.CharField(max_length=50)),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.imageblob'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='profile_image_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.imageblob'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='background_image_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.imageblob'),
+        ),
+        migrations.RunPython(images_to_blobs, blobs_to_images),
+        migrations.RemoveField(model_name='post', name='image'),
+        migrations.RemoveField(model_name='profile', name='profile_image'),
+        migrations.RemoveField(model_name='profile', name='background_image'),
+        migrations.RenameField(model_name='post', old_name='image_blob', new_name='image'),
+        migrations.RenameField(model_name='profile', old_name='profile_image_blob', new_name='profile_image'),
+        migrations.RenameField(model_name='profile', old_name='background_image_blob', new_name='background_image'),
+    ]
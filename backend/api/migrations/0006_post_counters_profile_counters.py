@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, column):
+    # Frozen copy of api.counters._count: rows of `model` pointing at each row
+    rows = model.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    Profile = apps.get_model('api', 'Profile')
+    Post.objects.update(likes_count=_count(Post.likes.through, 'post'), comments_count=_count(Comment, 'post'))
+    # Profile.followers: `X.followers` are the rows with from_profile=X
+    follows = Profile.followers.through
+    Profile.objects.update(
+        followers_count=_count(follows, 'from_profile'), following_count=_count(follows, 'to_profile'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_imageblob_move_images_to_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
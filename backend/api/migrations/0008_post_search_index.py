@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Frozen copy of the FTS5 table of api.search.SQLiteFTSBackend as of this
+# migration, so later changes there cannot change what it does
+TABLE = 'api_post_search'
+
+
+def create_search_index(apps, schema_editor):
+    # Only SQLite keeps a separate FTS5 table; see api.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+            'title, content, author, comments, tokenize = "unicode61 remove_diacritics 2")'
+        )
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, title, content, author, comments) '
+            'SELECT p.id, p.title, p.content, u.username, '
+            '(SELECT group_concat(c.content, \' \') FROM api_comment c WHERE c.post_id = p.id) '
+            'FROM api_post p INNER JOIN auth_user u ON u.id = p.author_id'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_trending_scores(apps, schema_editor):
+    # Frozen copy of api.trending.recompute as of this migration: likes weigh
+    # 1 and comments 2, halving every TRENDING_HALF_LIFE_HOURS since the
+    # post's (likes) or the comment's creation
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24)
+    now = timezone.now()
+    horizon = now - timedelta(hours=10 * half_life)
+
+    def decayed(created_at):
+        return 0.5 ** ((now - created_at).total_seconds() / 3600 / half_life)
+
+    scores = {}
+    posts = Post.objects.filter(created_at__gte=horizon, likes_count__gt=0)
+    for pk, created_at, likes_count in posts.values_list('pk', 'created_at', 'likes_count').iterator(1000):
+        scores[pk] = 1.0 * likes_count * decayed(created_at)
+    comments = Comment.objects.filter(created_at__gte=horizon)
+    for post_id, created_at in comments.values_list('post_id', 'created_at').iterator(1000):
+        scores[post_id] = scores.get(post_id, 0) + 2.0 * decayed(created_at)
+    Post.objects.bulk_update(
+        [Post(pk=pk, trending_score=score) for pk, score in scores.items()], ['trending_score'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_post_updated_at_postchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_show', True)), fields=['-trending_score', '-id'], name='post_trending'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_show', True)), fields=['category', '-trending_score', '-id'], name='post_category_trending'),
+        ),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
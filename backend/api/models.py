@@ -1,9 +1,22 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.functions import Now
+from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 
+class ImageBlob(models.Model):
+    # Content-addressed: the key is the sha256 of the bytes in api.storage
+    key = models.CharField(max_length=64, primary_key=True)
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     
@@ -16,23 +29,74 @@ class Post(models.Model):
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_show = models.BooleanField(default=True)   # User controls this (Hide/Show)
     is_active = models.BooleanField(default=True) # Admin controls this
-    image = models.TextField(null=True, blank=True) # Storing Base64 string here
+    image = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     
     # Now this works because Category is defined above
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
-    likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    likes = models.ManyToManyField(User, through='Like', related_name='liked_posts', blank=True)
+
+    # Denormalized counters, kept in step by the views with F() updates
+    # (repair drift with `manage.py repair_counters`)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    # Time-decayed engagement for the trending feed (api.trending); bumped by
+    # likes and comments, decayed by `manage.py decay_trending`
+    trending_score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # get_posts: visible posts, newest first (partial: only visible rows)
+            models.Index(
+                fields=['-created_at', '-id'], name='post_visible_recent',
+                condition=models.Q(is_active=True, is_show=True),
+            ),
+            # get_my_posts / get_profile: one author's posts, newest first
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent'),
+            # Trending, overall and per category: the top K is the head of the index
+            models.Index(
+                fields=['-trending_score', '-id'], name='post_trending',
+                condition=models.Q(is_active=True, is_show=True),
+            ),
+            models.Index(
+                fields=['category', '-trending_score', '-id'], name='post_category_trending',
+                condition=models.Q(is_active=True, is_show=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
     
+class Like(models.Model):
+    # Post.likes' table. Liking goes through raw INSERTs (api.relations), so
+    # the timestamp is a database default; the trending score decays each
+    # like from it (api.trending).
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        db_table = 'api_post_likes'
+        unique_together = [('post', 'user')]
+        indexes = [
+            # trending.recompute(): the likes within the decay horizon
+            models.Index(fields=['created_at'], name='like_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} likes {self.post_id}'
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True, null=True)
-    profile_image = models.TextField(blank=True, null=True) # Base64
-    background_image = models.TextField(blank=True, null=True) # Base64
+    profile_image = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    background_image = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
@@ -43,14 +107,106 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='comment_post_created'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} - {self.content[:20]}'
     
+class TimelineEntry(models.Model):
+    # Materialized "following" timeline, filled by fan-out on write (api.timeline).
+    # created_at copies the post's, so a timeline page is an index range scan.
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_recent'),
+        ]
+
+    def __str__(self):
+        return f'{self.owner.username} <- {self.post_id}'
+
+
+class PostChange(models.Model):
+    # Change log behind /api/posts/changes/ (api.changes). Compacted to the
+    # latest row per post; delete tombstones are pruned after
+    # CHANGE_LOG_RETENTION. The id is the sync position.
+    POST = 'post'      # created, edited, hidden/shown, commented on
+    COUNTS = 'counts'  # only the like count moved
+    DELETE = 'delete'
+    KIND_CHOICES = [(POST, 'Post'), (COUNTS, 'Counts'), (DELETE, 'Delete')]
+
+    # Not a foreign key: rows outlive the posts they describe
+    post_id = models.BigIntegerField()
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post_id'], name='post_change_post'),
+            models.Index(fields=['kind', 'created_at'], name='post_change_kind_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.post_id}'
+
+
+class Job(models.Model):
+    # Background work queued by the write endpoints (api.jobs), run by
+    # `manage.py run_jobs`. Finished jobs are deleted; failed ones stay for a look.
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Idempotency key: at most one queued job per key, see api.jobs.enqueue()
+    key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='queued'), name='unique_queued_job_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+# A profile is created with its user and otherwise saved on its own, never as a
+# side effect of User.save() (last_login, name edits). Users that come in
+# without the signal (bulk_create, fixtures, raw SQL) get one on first write
+# through profile_for().
+
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         Profile.objects.create(user=instance)
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+
+def profile_for(user):
+    """
+    The user's profile, created if it is missing.
+    """
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+# Keyset (cursor) pagination on (created_at, id).
+# The cursor stores the position of a boundary row, so every page is a plain
+# "WHERE (created_at, id) < (x, y) ORDER BY ... LIMIT n" query. Its cost does not
+# depend on how deep the client has scrolled, and new posts arriving at the top
+# of the feed never shift the rows of a page the client already has.
+
+NEXT = 'n'
+PREV = 'p'
+
+DEFAULT_KEYS = ('created_at', 'id')
+
+
+def encode_cursor(position, direction):
+    created_at, pk = position
+    payload = json.dumps({'t': created_at.isoformat(), 'i': pk, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        created_at = parse_datetime(data['t'])
+        pk = int(data['i'])
+        direction = data['d']
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    if created_at is None or direction not in (NEXT, PREV):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    return (created_at, pk), direction
+
+
+def get_page_size(request):
+    default = getattr(settings, 'API_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    raw = request.query_params.get('page_size')
+    if raw is None:
+        return default
+    try:
+        size = int(raw)
+    except ValueError:
+        raise ValidationError({'page_size': 'Must be an integer.'})
+    if size < 1:
+        raise ValidationError({'page_size': 'Must be at least 1.'})
+    return min(size, maximum)
+
+
+def get_cursor(request):
+    """
+    Returns (position, direction) for the request's cursor, or (None, None).
+    """
+    cursor = request.query_params.get('cursor')
+    if not cursor:
+        return None, None
+    return decode_cursor(cursor)
+
+
+class CursorPage:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def response_data(self, results):
+        return {
+            'results': results,
+            'next': self.next_cursor,
+            'previous': self.prev_cursor,
+        }
+
+
+def _window_query(queryset, position, direction, limit, keys):
+    # (query, flip): the rows come back oldest first when `flip` is set
+    time_key, id_key = keys
+    if position is None:
+        return queryset.order_by(f'-{time_key}', f'-{id_key}')[:limit], False
+
+    created_at, pk = position
+    if direction == NEXT:
+        # Rows strictly older than the boundary row
+        keyset = Q(**{f'{time_key}__lt': created_at}) | Q(**{time_key: created_at, f'{id_key}__lt': pk})
+        return queryset.filter(keyset).order_by(f'-{time_key}', f'-{id_key}')[:limit], False
+
+    # Rows strictly newer than the boundary row, walked upwards and flipped back
+    keyset = Q(**{f'{time_key}__gt': created_at}) | Q(**{time_key: created_at, f'{id_key}__gt': pk})
+    return queryset.filter(keyset).order_by(time_key, id_key)[:limit], True
+
+
+def window(queryset, position, direction, limit, keys=DEFAULT_KEYS):
+    """
+    Up to `limit` rows next to `position` in the given direction, returned
+    newest first. `keys` names the (timestamp, id) pair the rows are ordered by.
+    """
+    query, flip = _window_query(queryset, position, direction, limit, keys)
+    rows = list(query)
+    return rows[::-1] if flip else rows
+
+
+async def awindow(queryset, position, direction, limit, keys=DEFAULT_KEYS):
+    """
+    window() for async views.
+    """
+    query, flip = _window_query(queryset, position, direction, limit, keys)
+    rows = [row async for row in query]
+    return rows[::-1] if flip else rows
+
+
+def build_page(rows, page_size, direction, position_of):
+    """
+    Cuts a page out of newest-first `rows` fetched with one row of look-ahead
+    (limit=page_size + 1) and attaches the cursors around it.
+    """
+    has_more = len(rows) > page_size
+    if direction == PREV:
+        # The look-ahead row is the newest one, i.e. the first
+        items = rows[-page_size:] if has_more else rows
+        next_cursor = encode_cursor(position_of(items[-1]), NEXT) if items else None
+        prev_cursor = encode_cursor(position_of(items[0]), PREV) if has_more else None
+    else:
+        items = rows[:page_size]
+        next_cursor = encode_cursor(position_of(items[-1]), NEXT) if has_more else None
+        prev_cursor = encode_cursor(position_of(items[0]), PREV) if direction == NEXT and items else None
+    return CursorPage(items, next_cursor, prev_cursor)
+
+
+def paginate(request, queryset):
+    """
+    Returns one newest-first CursorPage of `queryset`, driven by the
+    `cursor` and `page_size` query parameters.
+    """
+    page_size = get_page_size(request)
+    position, direction = get_cursor(request)
+    rows = window(queryset, position, direction, page_size + 1)
+    return build_page(rows, page_size, direction, lambda obj: (obj.created_at, obj.pk))
+
+
+async def apaginate(request, queryset):
+    """
+    paginate() for async views.
+    """
+    page_size = get_page_size(request)
+    position, direction = get_cursor(request)
+    rows = await awindow(queryset, position, direction, page_size + 1)
+    return build_page(rows, page_size, direction, lambda obj: (obj.created_at, obj.pk))
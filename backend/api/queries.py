@@ -0,0 +1,124 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post, Profile, Comment
+
+
+# Query planning for list rendering.
+# PostSerializer touches author, author.profile, category, likes and the
+# comment preview (and every comment touches user and user.profile). Rendered
+# naively that is a handful of queries per post; planned here it is a fixed
+# number per page.
+
+def comment_preview_size():
+    return getattr(settings, 'COMMENT_PREVIEW_SIZE', 3)
+
+
+def latest_comments():
+    """
+    Comments newest first, with their authors and profiles joined.
+    """
+    return Comment.objects.select_related('user__profile').order_by('-created_at', '-id')
+
+
+def plan_posts(queryset, fields=None):
+    """
+    Joins the single-valued relations the selected `fields` need (None = all).
+    Like and comment counts are stored on Post itself; the comment preview is
+    loaded by attach_latest_comments().
+    """
+    wanted = set(fields) if fields is not None else None
+    related = []
+    if wanted is None or 'author_image' in wanted:
+        related.append('author__profile')
+    elif 'author' in wanted:
+        related.append('author')
+    if wanted is None or 'category_name' in wanted:
+        related.append('category')
+    return queryset.select_related(*related)
+
+
+def latest_comment_ids(post_ids, size):
+    """
+    Subquery (for id__in) selecting the ids of the latest `size` comments of
+    every post in `post_ids`.
+    """
+    # UNION ALL of one LIMITed index seek per post. Written out by hand because
+    # the ORM refuses LIMIT inside compound statements on SQLite; wrapping every
+    # arm in a derived table makes it valid there and everywhere else.
+    quote = connection.ops.quote_name
+    table = quote(Comment._meta.db_table)
+    arm = (
+        f'SELECT {quote("id")} FROM (SELECT {quote("id")} FROM {table} WHERE {quote("post_id")} = %s '
+        f'ORDER BY {quote("created_at")} DESC, {quote("id")} DESC LIMIT %s) AS {quote("latest")}'
+    )
+    params = []
+    for post_id in post_ids:
+        params += [post_id, size]
+    return RawSQL(' UNION ALL '.join([arm] * len(post_ids)), params)
+
+
+def attach_latest_comments(posts):
+    """
+    Sets `latest_comments` (newest first) on every post, in one query.
+    Each post adds an index seek for at most COMMENT_PREVIEW_SIZE ids, so a
+    post with thousands of comments costs the same as one with three.
+    """
+    posts = list(posts)
+    size = comment_preview_size()
+    by_post = defaultdict(list)
+    if posts and size > 0:
+        ids = latest_comment_ids([post.pk for post in posts], size)
+        for comment in Comment.objects.filter(id__in=ids).select_related('user__profile'):
+            by_post[comment.post_id].append(comment)
+    for post in posts:
+        post.latest_comments = sorted(by_post[post.pk], key=lambda c: (c.created_at, c.pk), reverse=True)
+    return posts
+
+
+def _liked(user, post_ids):
+    return (
+        Post.likes.through.objects
+        .filter(user_id=user.id, post_id__in=post_ids)
+        .values_list('post_id', flat=True)
+    )
+
+
+def liked_post_ids(user, post_ids):
+    """
+    One query answering "which of these posts has `user` liked?".
+    """
+    if not user or not user.is_authenticated or not post_ids:
+        return set()
+    return set(_liked(user, post_ids))
+
+
+async def aliked_post_ids(user, post_ids):
+    if not user or not user.is_authenticated or not post_ids:
+        return set()
+    return {post_id async for post_id in _liked(user, post_ids)}
+
+
+def _following(user, username):
+    # `target.followers` holds rows with from_profile=target, to_profile=follower
+    return Profile.followers.through.objects.filter(
+        from_profile__user__username=username, to_profile__user_id=user.id
+    )
+
+
+def is_following(user, username):
+    """
+    Whether `user` follows the profile of `username`, in one query.
+    """
+    if not user or not user.is_authenticated:
+        return False
+    return _following(user, username).exists()
+
+
+async def ais_following(user, username):
+    if not user or not user.is_authenticated:
+        return False
+    return await _following(user, username).aexists()
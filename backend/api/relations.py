@@ -0,0 +1,140 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from .counters import bump_many
+from .models import Post, Profile
+
+
+# Idempotent write path for likes and follows.
+# Instead of exists() -> add()/remove() -> count(), each write is one
+# conflict-tolerant INSERT or a DELETE on the M2M table, and the counter is
+# only moved when that statement actually changed a row. Concurrent duplicate
+# requests therefore cannot double-count, and a request costs two statements.
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _write_edge(through, values, present):
+    """
+    Inserts (present=True) or deletes the M2M row `values` ({column: id}).
+    Returns True when a row was actually inserted or deleted.
+    """
+    table = _quote(through._meta.db_table)
+    columns = [_quote(through._meta.get_field(name).column) for name in values]
+    params = list(values.values())
+    with connection.cursor() as cursor:
+        if present:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+                f'ON CONFLICT DO NOTHING',
+                params,
+            )
+        else:
+            where = ' AND '.join(f'{column} = %s' for column in columns)
+            cursor.execute(f'DELETE FROM {table} WHERE {where}', params)
+        return cursor.rowcount == 1
+
+
+def _add_to_counter(model, pk, field, delta):
+    """
+    Adds `delta` to a counter column (clamped at zero) and returns the new
+    value, or None if the row does not exist.
+    """
+    table = _quote(model._meta.db_table)
+    column = _quote(model._meta.get_field(field).column)
+    pk_column = _quote(model._meta.pk.column)
+    sql = (
+        f'UPDATE {table} SET {column} = CASE WHEN {column} + %s < 0 THEN 0 ELSE {column} + %s END '
+        f'WHERE {pk_column} = %s'
+    )
+    with connection.cursor() as cursor:
+        if connection.features.can_return_columns_from_insert:
+            cursor.execute(f'{sql} RETURNING {column}', [delta, delta, pk])
+            row = cursor.fetchone()
+            return row[0] if row else None
+        cursor.execute(sql, [delta, delta, pk])
+        if cursor.rowcount == 0:
+            return None
+    return model.objects.filter(pk=pk).values_list(field, flat=True).first()
+
+
+def _send_changed(through, instance, model, pk, present):
+    # The raw statements bypass the related manager, so announce the change the
+    # way post.likes.add()/remove() would (cache invalidation listens to this)
+    m2m_changed.send(
+        sender=through, instance=instance, action='post_add' if present else 'post_remove',
+        reverse=False, model=model, pk_set={pk}, using=connection.alias,
+    )
+
+
+def _read_counter(model, pk, field):
+    return model.objects.filter(pk=pk).values_list(field, flat=True).first()
+
+
+def set_like(post_id, user_id, liked):
+    """
+    Makes "user likes post" equal `liked`. Returns the post's like count, or
+    None if the post does not exist (nothing is written in that case).
+    """
+    with transaction.atomic():
+        changed = _write_edge(Post.likes.through, {'post': post_id, 'user': user_id}, liked)
+        if changed:
+            count = _add_to_counter(Post, post_id, 'likes_count', 1 if liked else -1)
+        else:
+            count = _read_counter(Post, post_id, 'likes_count')
+        if count is None:
+            # Unknown post: undo the insert before the deferred FK check fails
+            transaction.set_rollback(True)
+        elif changed:
+            _send_changed(Post.likes.through, Post(pk=post_id), User, user_id, liked)
+    return count
+
+
+def set_likes(user_id, liked):
+    """
+    set_like() for several posts in one transaction: `liked` maps post id ->
+    bool. Returns {post id: like count} for the posts that exist; unknown ids
+    are left out and nothing is written for them. Counters move in one UPDATE
+    and the change is announced once per direction.
+    """
+    with transaction.atomic():
+        existing = set(Post.objects.filter(pk__in=liked).values_list('pk', flat=True))
+        changed = {True: set(), False: set()}
+        for post_id, present in liked.items():
+            if post_id in existing and _write_edge(Post.likes.through, {'post': post_id, 'user': user_id}, present):
+                changed[present].add(post_id)
+        bump_many(Post, 'likes_count', {
+            **dict.fromkeys(changed[True], 1),
+            **dict.fromkeys(changed[False], -1),
+        })
+        for present, post_ids in changed.items():
+            if post_ids:
+                m2m_changed.send(
+                    sender=Post.likes.through, instance=User(pk=user_id),
+                    action='post_add' if present else 'post_remove',
+                    reverse=True, model=Post, pk_set=post_ids, using=connection.alias,
+                )
+        return dict(Post.objects.filter(pk__in=existing).values_list('pk', 'likes_count'))
+
+
+def set_follow(follower_id, target_id, following):
+    """
+    Makes "profile follower_id follows profile target_id" equal `following`.
+    Returns the target's follower count.
+    """
+    with transaction.atomic():
+        # `target.followers` holds rows with from_profile=target, to_profile=follower
+        changed = _write_edge(
+            Profile.followers.through,
+            {'from_profile': target_id, 'to_profile': follower_id},
+            following,
+        )
+        if not changed:
+            return _read_counter(Profile, target_id, 'followers_count')
+        delta = 1 if following else -1
+        _add_to_counter(Profile, follower_id, 'following_count', delta)
+        count = _add_to_counter(Profile, target_id, 'followers_count', delta)
+        _send_changed(Profile.followers.through, Profile(pk=target_id), Profile, follower_id, following)
+        return count
@@ -0,0 +1,38 @@
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import measure_serialization
+
+try:
+    import orjson
+except ImportError:  # optional, JSONRenderer's own encoder is used without it
+    orjson = None
+
+PASSTHROUGH = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed. The bytes are
+    the same as JSONRenderer's compact output; anything orjson would render
+    differently (indented output for the browsable API, ASCII-only mode,
+    types it does not know) falls back to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure_serialization():
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates and dataclasses go through JSONRenderer's encoder, so they
+            # come out exactly as before
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=PASSTHROUGH)
+        except TypeError:
+            # Big ints, non-str keys, anything the encoder refuses too
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for JavaScript compatibility
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
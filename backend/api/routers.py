@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import transaction
+
+
+# Sends reads to the 'replica' alias and everything else to 'default'.
+# A read inside a transaction on 'default' stays there, so a view always sees
+# its own uncommitted writes (and tests, which run inside a transaction, never
+# touch the replica). Without a 'replica' alias (the development profile) the
+# router has no opinion and Django uses 'default' throughout.
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if REPLICA not in settings.DATABASES:
+            return None
+        if transaction.get_connection(PRIMARY).in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same database behind both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,248 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .jobs import enqueue
+from .models import Post, Comment
+
+
+# Full-text search over posts (title, content, author name and comments).
+# The backend is picked by SEARCH_BACKEND, or by database vendor when unset:
+# SQLite keeps an FTS5 table (created in migration 0008) in sync through the
+# signals at the bottom, which queue the reindexing as a background job
+# (api.jobs), including every post of a renamed author; Postgres ranks a
+# tsvector of the same four fields; anything else falls back to icontains
+# scans of title and content.
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 10
+
+
+class SearchBackend:
+    """
+    icontains fallback; also the interface of the real backends.
+    """
+
+    def search(self, query, category=None, visible_only=True, limit=20, offset=0):
+        """
+        Post ids matching `query`, best match first.
+        """
+        terms = TERM_RE.findall(query)[:MAX_TERMS]
+        if not terms:
+            return []
+        posts = Post.objects.all()
+        if visible_only:
+            posts = posts.filter(is_active=True, is_show=True)
+        if category is not None:
+            posts = posts.filter(category_id=category)
+        for term in terms:
+            posts = posts.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        return list(posts.order_by('-created_at', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+    def index_post(self, post_id):
+        pass
+
+    def index_posts(self, post_ids):
+        for post_id in post_ids:
+            self.index_post(post_id)
+
+    def index_author(self, author_id):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTSBackend(SearchBackend):
+    table = 'api_post_search'
+    # bm25 column weights: title, content, author, comments
+    weights = (10.0, 1.0, 5.0, 0.5)
+
+    # One row per post, rowid = post id
+    SOURCE_SQL = (
+        'SELECT p.id, p.title, p.content, u.username, '
+        '(SELECT group_concat(c.content, \' \') FROM api_comment c WHERE c.post_id = p.id) '
+        'FROM api_post p INNER JOIN auth_user u ON u.id = p.author_id'
+    )
+
+    @classmethod
+    def create_table(cls, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {cls.table} USING fts5('
+            'title, content, author, comments, tokenize = "unicode61 remove_diacritics 2")'
+        )
+
+    @classmethod
+    def fill_table(cls, cursor):
+        cursor.execute(f'DELETE FROM {cls.table}')
+        cursor.execute(f'INSERT INTO {cls.table} (rowid, title, content, author, comments) {cls.SOURCE_SQL}')
+
+    @staticmethod
+    def match_expression(query):
+        terms = TERM_RE.findall(query)[:MAX_TERMS]
+        if not terms:
+            return None
+        # Quote every term so user input can't inject FTS5 syntax; the last one
+        # matches as a prefix for search-as-you-type
+        quoted = ['"{}"'.format(term.replace('"', '')) for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, query, category=None, visible_only=True, limit=20, offset=0):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        sql = (
+            f'SELECT p.id FROM {self.table} s INNER JOIN api_post p ON p.id = s.rowid '
+            f'WHERE {self.table} MATCH %s'
+        )
+        params = [match]
+        if visible_only:
+            sql += ' AND p.is_active AND p.is_show'
+        if category is not None:
+            sql += ' AND p.category_id = %s'
+            params.append(category)
+        sql += f' ORDER BY bm25({self.table}, {weights}), p.id DESC LIMIT %s OFFSET %s'
+        params += [limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content, author, comments) {self.SOURCE_SQL} WHERE p.id = %s',
+                [post_id],
+            )
+
+    def index_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', post_ids)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content, author, comments) {self.SOURCE_SQL} '
+                f'WHERE p.id IN ({placeholders})',
+                post_ids,
+            )
+
+    def index_author(self, author_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN (SELECT id FROM api_post WHERE author_id = %s)',
+                [author_id],
+            )
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content, author, comments) {self.SOURCE_SQL} '
+                f'WHERE p.author_id = %s',
+                [author_id],
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            self.create_table(cursor)
+            self.fill_table(cursor)
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Ranks a tsvector built per query. Add a GIN index on the same expression
+    (or a stored generated column) before relying on it for large tables.
+    """
+
+    def search(self, query, category=None, visible_only=True, limit=20, offset=0):
+        from django.contrib.postgres.aggregates import StringAgg
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        terms = TERM_RE.findall(query)[:MAX_TERMS]
+        if not terms:
+            return []
+        # One string per post, like the comments column of the FTS5 table
+        comments = (
+            Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+            .annotate(text=StringAgg('content', delimiter=' ')).values('text')
+        )
+        vector = (
+            SearchVector('title', weight='A')
+            + SearchVector('author__username', weight='B')
+            + SearchVector('content', weight='C')
+            + SearchVector(Subquery(comments), weight='D')
+        )
+        search_query = SearchQuery(' '.join(terms), search_type='plain')
+        posts = Post.objects.annotate(rank=SearchRank(vector, search_query)).filter(rank__gt=0)
+        if visible_only:
+            posts = posts.filter(is_active=True, is_show=True)
+        if category is not None:
+            posts = posts.filter(category_id=category)
+        return list(posts.order_by('-rank', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SearchBackend()
+
+
+def index_later(post_ids):
+    """
+    Queues (re)indexing of the given posts as a background job.
+    """
+    post_ids = sorted(set(post_ids))
+    if post_ids:
+        key = f'search:post:{post_ids[0]}' if len(post_ids) == 1 else None
+        enqueue('search.index_posts', key=key, post_ids=post_ids)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, **kwargs):
+    index_later([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    index_later([instance.post_id])
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # Without loading it when the query deferred it
+    instance._indexed_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # The index holds the author's name, so a rename reindexes their posts
+    if not created and instance._indexed_username not in (None, instance.username):
+        enqueue('search.index_author', key=f'search:author:{instance.pk}', author_id=instance.pk)
+    instance._indexed_username = instance.username
@@ -0,0 +1,204 @@
+import io
+import random
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import get_cache
+from .images import Image, store_image
+from .models import Post, Profile, Comment, Category, TimelineEntry
+from .search import get_search_backend
+from .timeline import fanout_limit
+from .trending import recompute
+
+
+# Synthetic data for local testing and the benchmarks.
+# Everything is written with bulk_create, which skips the model signals, so
+# the work they would do is done here in bulk instead: profiles are created
+# alongside users, counters are computed up front, timelines are filled for
+# every follow, and the trending scores and search index are rebuilt at the
+# end. The per-process read cache is cleared, since nothing invalidated it.
+#
+# All users get the password SEED_PASSWORD, hashed once.
+
+SEED_PASSWORD = 'password'
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et '
+    'dolore magna aliqua django react python sqlite cache query index feed profile comment travel food '
+    'music design garden coffee weekend mountain river city night morning story photo'
+).split()
+
+CATEGORY_NAMES = ('News', 'Tech', 'Travel', 'Food', 'Music', 'Design', 'Sports', 'Science', 'Books', 'Life')
+
+
+def _text(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def _png(width, height, rgb):
+    # A solid-color PNG without Pillow
+    def chunk(kind, data):
+        return len(data).to_bytes(4, 'big') + kind + data + zlib.crc32(kind + data).to_bytes(4, 'big')
+    row = b'\x00' + bytes(rgb) * width
+    header = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + b'\x08\x02\x00\x00\x00'
+    return (
+        b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+        + chunk(b'IDAT', zlib.compress(row * height)) + chunk(b'IEND', b'')
+    )
+
+
+def _images(rng, count):
+    keys = []
+    for _ in range(count):
+        rgb = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if Image is not None:
+            out = io.BytesIO()
+            Image.new('RGB', (800, 600), rgb).save(out, 'PNG')
+            data = out.getvalue()
+        else:
+            data = _png(800, 600, rgb)
+        keys.append(store_image(data, 'image/png').key)
+    return keys
+
+
+def _around(rng, average):
+    return rng.randint(0, 2 * average) if average else 0
+
+
+def seed(users=100, posts=1000, comments=5, likes=10, follows=10, categories=8, image_ratio=0.3,
+         days=30, prefix='seed', rng=None):
+    """
+    Creates `users` users (with profiles) and `posts` posts spread over the
+    last `days` days. `comments` and `likes` are averages per post, `follows`
+    per user; `image_ratio` of the posts and profiles get an image. Returns
+    the number of rows created per model.
+    """
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f'Users named "{prefix}..." already exist; pick another prefix.')
+    with transaction.atomic():
+        password = make_password(SEED_PASSWORD)
+        created_users = User.objects.bulk_create(
+            (
+                User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password,
+                     first_name=rng.choice(WORDS).title(), last_name=rng.choice(WORDS).title())
+                for i in range(users)
+            ),
+            batch_size=1000,
+        )
+        user_ids = [user.pk for user in created_users]
+        images = _images(rng, max(1, min(10, round(posts * image_ratio)))) if image_ratio else []
+
+        # Follows first, so the profile counters can be set on insert
+        following = {}
+        for user_id in user_ids:
+            count = min(_around(rng, follows), users - 1)
+            following[user_id] = [other for other in rng.sample(user_ids, count + 1) if other != user_id][:count]
+        followers = dict.fromkeys(user_ids, 0)
+        for followed in following.values():
+            for user_id in followed:
+                followers[user_id] += 1
+        profiles = Profile.objects.bulk_create(
+            (
+                Profile(
+                    user_id=user_id, bio=_text(rng, 5, 20),
+                    profile_image_id=rng.choice(images) if images and rng.random() < image_ratio else None,
+                    followers_count=followers[user_id], following_count=len(following[user_id]),
+                )
+                for user_id in user_ids
+            ),
+            batch_size=1000,
+        )
+        profile_ids = {profile.user_id: profile.pk for profile in profiles}
+        # `target.followers` holds rows with from_profile=target, to_profile=follower
+        Profile.followers.through.objects.bulk_create(
+            (
+                Profile.followers.through(from_profile_id=profile_ids[target], to_profile_id=profile_ids[user_id])
+                for user_id, followed in following.items() for target in followed
+            ),
+            batch_size=1000,
+        )
+
+        # Reuses categories that already exist under the same name
+        names = [
+            name if i < len(CATEGORY_NAMES) else f'{name} {i // len(CATEGORY_NAMES) + 1}'
+            for i, name in ((i, CATEGORY_NAMES[i % len(CATEGORY_NAMES)]) for i in range(categories))
+        ]
+        existing = set(Category.objects.filter(name__in=names).values_list('name', flat=True))
+        Category.objects.bulk_create(Category(name=name) for name in names if name not in existing)
+        category_ids = list(Category.objects.filter(name__in=names).values_list('pk', flat=True))
+
+        plans = []
+        for _ in range(posts):
+            likers = rng.sample(user_ids, min(_around(rng, likes), users))
+            plans.append((likers, _around(rng, comments)))
+        created_posts = Post.objects.bulk_create(
+            (
+                Post(
+                    title=_text(rng, 2, 8)[:100], content=_text(rng, 30, 200), author_id=rng.choice(user_ids),
+                    category_id=rng.choice(category_ids) if category_ids and rng.random() < 0.8 else None,
+                    image_id=rng.choice(images) if images and rng.random() < image_ratio else None,
+                    is_show=rng.random() > 0.05, likes_count=len(likers), comments_count=comment_count,
+                )
+                for likers, comment_count in plans
+            ),
+            batch_size=1000,
+        )
+        # auto_now_add stamps everything "now"; spread the posts over `days`, one UPDATE per day
+        stamps = [now - timedelta(days=day, seconds=rng.randrange(86400)) for day in range(max(days, 1))]
+        by_stamp = {}
+        for post in created_posts:
+            post.created_at = rng.choice(stamps)
+            by_stamp.setdefault(post.created_at, []).append(post.pk)
+        for created_at, post_ids in by_stamp.items():
+            Post.objects.filter(pk__in=post_ids).update(created_at=created_at, updated_at=created_at)
+
+        Post.likes.through.objects.bulk_create(
+            (
+                Post.likes.through(post_id=post.pk, user_id=user_id)
+                for post, (likers, _) in zip(created_posts, plans) for user_id in likers
+            ),
+            batch_size=1000,
+        )
+        Comment.objects.bulk_create(
+            (
+                Comment(post_id=post.pk, user_id=rng.choice(user_ids), content=_text(rng, 3, 30))
+                for post, (_, comment_count) in zip(created_posts, plans) for _ in range(comment_count)
+            ),
+            batch_size=1000,
+        )
+
+        # Home timelines: own posts plus those of followed authors under the fan-out limit
+        posts_by_author = {}
+        for post in created_posts:
+            if post.is_show:
+                posts_by_author.setdefault(post.author_id, []).append(post)
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(owner_id=user_id, post_id=post.pk, created_at=post.created_at)
+                for user_id in user_ids
+                for author_id in [user_id] + [a for a in following[user_id] if followers[a] <= fanout_limit()]
+                for post in posts_by_author.get(author_id, ())
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+        recompute()
+        get_search_backend().rebuild()
+    get_cache().clear()
+    return {
+        'users': users,
+        'posts': posts,
+        'comments': sum(comment_count for _, comment_count in plans),
+        'likes': sum(len(likers) for likers, _ in plans),
+        'follows': sum(len(followed) for followed in following.values()),
+        'categories': len(category_ids),
+        'images': len(images),
+    }
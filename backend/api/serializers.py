@@ -1,7 +1,83 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Post, Profile, Comment, Category
+from .models import Post, Profile, Comment, Category, ImageBlob
 from django.contrib.auth.password_validation import validate_password
+from .images import InvalidImage, decode_image, store_image, key_from_url, image_url
+from .jobs import enqueue
+from .queries import comment_preview_size, latest_comments
+
+
+class UpdateFieldsMixin:
+    """
+    Saves only the columns present in the request, so an edit cannot write back
+    stale counters (likes_count, followers_count, ...) that F() updates moved
+    in the meantime.
+    """
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if validated_data:
+            # auto_now columns (updated_at) are only written when listed
+            auto_now = [field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)]
+            instance.save(update_fields=list(validated_data) + auto_now)
+        return instance
+
+
+class SparseFieldsMixin:
+    """
+    Accepts `fields=` (field names, see api.fieldsets) and drops every other
+    field up front, so skipped method fields are never evaluated.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class BlobImageField(serializers.Field):
+    """
+    Reads as a URL to the image endpoint, writes from a base64 data URL.
+    Bound to the `<field>_id` attribute so rendering never joins ImageBlob.
+    `variant` picks the size that is rendered; `variants` are generated in a
+    background job when a new image is uploaded.
+    """
+
+    def __init__(self, variant='full', variants=(), **kwargs):
+        self.variant = variant
+        self.variants = variants
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return image_url(value, self.context.get('request'), self.variant)
+
+    def to_internal_value(self, data):
+        if not data:
+            return None
+        if not isinstance(data, str):
+            raise serializers.ValidationError('Expected a base64 data URL.')
+        # Clients echo back the URL we gave them when the image is unchanged
+        key = key_from_url(data)
+        if key is not None:
+            if not ImageBlob.objects.filter(pk=key).exists():
+                raise serializers.ValidationError('Unknown image.')
+            return key
+        try:
+            content, content_type = decode_image(data)
+        except InvalidImage as e:
+            raise serializers.ValidationError(str(e))
+        blob = store_image(content, content_type)
+        if self.variants:
+            # Resizing is slow; the image endpoint renders a missing variant on demand anyway
+            enqueue(
+                'images.generate_variants', key=f'variants:{blob.key}',
+                blob_key=blob.key, names=list(self.variants),
+            )
+        return blob.key
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -28,10 +104,14 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
         
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     user_image = serializers.SerializerMethodField()
 
+    presets = {
+        'summary': ['id', 'user', 'content', 'created_at'],
+    }
+
     class Meta:
         model = Comment
         fields = ['id', 'user', 'user_image', 'content', 'created_at']
@@ -39,28 +119,29 @@ class CommentSerializer(serializers.ModelSerializer):
     def get_user_image(self, obj):
         # FIX: Check if profile exists to prevent 500 errors on old users
         if hasattr(obj.user, 'profile'):
-            return obj.user.profile.profile_image
+            return image_url(obj.user.profile.profile_image_id, self.context.get('request'), 'avatar64')
         return None
     
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsMixin, UpdateFieldsMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
     first_name = serializers.ReadOnlyField(source='user.first_name')
     last_name = serializers.ReadOnlyField(source='user.last_name')
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+    profile_image = BlobImageField(source='profile_image_id', variants=('avatar64',))
+    background_image = BlobImageField(source='background_image_id')
+    followers_count = serializers.ReadOnlyField()
+    following_count = serializers.ReadOnlyField()
     is_following = serializers.SerializerMethodField()
 
+    presets = {
+        'summary': ['username', 'first_name', 'last_name', 'profile_image'],
+        'card': ['username', 'first_name', 'last_name', 'bio', 'profile_image', 'followers_count', 'following_count', 'is_following'],
+    }
+
     class Meta:
         model = Profile
         fields = ['username', 'email', 'first_name', 'last_name', 'bio', 'profile_image', 'background_image', 'followers_count', 'following_count', 'is_following']
 
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-
-    def get_following_count(self, obj):
-        return obj.following.count()
-
     def get_is_following(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
@@ -69,24 +150,35 @@ class ProfileSerializer(serializers.ModelSerializer):
                 return request.user.profile.following.filter(id=obj.id).exists()
         return False
     
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsMixin, UpdateFieldsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    author_id = serializers.ReadOnlyField(source='author.id')
+    author_id = serializers.ReadOnlyField()
     author_image = serializers.SerializerMethodField()
     category_name = serializers.ReadOnlyField(source='category.name')
-    likes_count = serializers.SerializerMethodField()
+    image = BlobImageField(source='image_id', variants=('preview',))
+    image_preview = BlobImageField(source='image_id', variant='preview', read_only=True)
+    likes_count = serializers.ReadOnlyField()
+    comments_count = serializers.ReadOnlyField()
     is_liked = serializers.SerializerMethodField()
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
+
+    presets = {
+        'summary': ['id', 'title', 'author', 'author_id', 'category', 'category_name', 'created_at'],
+        'card': [
+            'id', 'title', 'author', 'author_id', 'author_image', 'category', 'category_name', 'created_at',
+            'image_preview', 'likes_count', 'comments_count', 'is_liked',
+        ],
+    }
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'content', 'author', 'author_id', 'author_image', 'category', 'category_name', 'created_at', 'is_show', 'is_active', 'image', 'likes_count', 'is_liked', 'comments']
-        read_only_fields = ['author', 'created_at', 'is_active']
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+        fields = ['id', 'title', 'content', 'author', 'author_id', 'author_image', 'category', 'category_name', 'created_at', 'updated_at', 'is_show', 'is_active', 'image', 'image_preview', 'likes_count', 'comments_count', 'is_liked', 'comments']
+        read_only_fields = ['author', 'created_at', 'updated_at', 'is_active']
 
     def get_is_liked(self, obj):
+        liked_ids = self.context.get('liked_post_ids')
+        if liked_ids is not None:
+            return obj.id in liked_ids
         request = self.context.get('request')
         # FIX: Add safety check for request context
         if request and request.user.is_authenticated:
@@ -96,5 +188,14 @@ class PostSerializer(serializers.ModelSerializer):
     def get_author_image(self, obj):
         # FIX: Check if profile exists
         if hasattr(obj.author, 'profile'):
-            return obj.author.profile.profile_image
-        return None
\ No newline at end of file
+            return image_url(obj.author.profile.profile_image_id, self.context.get('request'), 'avatar64')
+        return None
+
+    def get_comments(self, obj):
+        # Only a preview of the latest comments, oldest first; the full list is
+        # paged by /api/posts/<id>/comments/
+        latest = getattr(obj, 'latest_comments', None)
+        if latest is None:
+            size = comment_preview_size()
+            latest = latest_comments().filter(post=obj)[:size] if size > 0 else []
+        return CommentSerializer(list(latest)[::-1], many=True, context=self.context).data
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+# Content-addressed blob storage for uploaded images.
+# Blobs are keyed by the sha256 of their bytes, so a key always names the same
+# content: writing it twice is a no-op and readers may cache it forever.
+
+class LocalBlobStorage:
+    def __init__(self, location):
+        self.location = str(location)
+
+    def path(self, key):
+        # Two levels of fan-out keep directories small: ab/cd/abcd...
+        return os.path.join(self.location, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, data):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename, so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def delete(self, key):
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+
+@lru_cache(maxsize=None)
+def get_storage():
+    config = settings.IMAGE_STORAGE
+    backend = import_string(config['BACKEND'])
+    return backend(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_storage(setting, **kwargs):
+    if setting == 'IMAGE_STORAGE':
+        get_storage.cache_clear()
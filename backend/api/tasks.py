@@ -0,0 +1,27 @@
+from .images import generate_variants
+from .jobs import task
+from .search import get_search_backend
+from .timeline import push_author
+
+
+# Background tasks (see api.jobs). Each one may run more than once, so each
+# recomputes its result from the current rows instead of applying a delta.
+
+@task('images.generate_variants')
+def generate_image_variants(blob_key, names):
+    generate_variants(blob_key, names)
+
+
+@task('search.index_posts')
+def index_posts(post_ids):
+    get_search_backend().index_posts(post_ids)
+
+
+@task('search.index_author')
+def index_author_posts(author_id):
+    get_search_backend().index_author(author_id)
+
+
+@task('timeline.push_author')
+def push_author_posts(author_id):
+    push_author(author_id)
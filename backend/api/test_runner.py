@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs background jobs inline (api.jobs.LocalBackend), so tests see the
+    effects of a write when the request returns. Tests of the queue itself
+    switch JOBS_BACKEND back with override_settings.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._jobs = override_settings(JOBS_BACKEND='api.jobs.LocalBackend')
+        self._jobs.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._jobs.disable()
+        super().teardown_test_environment(**kwargs)
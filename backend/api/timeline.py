@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .jobs import enqueue
+from .models import Post, Profile, TimelineEntry
+from .pagination import PREV, build_page, get_cursor, get_page_size, window
+
+
+# Per-user "following" timeline.
+# Posts by normal authors are fanned out on write: create_post inserts one
+# TimelineEntry per follower. Authors with more than TIMELINE_FANOUT_LIMIT
+# followers are skipped on write and read straight from Post on read instead,
+# and get_timeline_page() merges the two sources into one cursor page.
+#
+# An author who drops back to the limit is pushed again from then on, but the
+# posts they made while above it were neither pushed nor are they pulled any
+# more. An unfollow that crosses the limit therefore queues push_author(),
+# which backfills the author's recent posts into every follower's timeline.
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def _insert(posts, owner_ids):
+    entries = [
+        TimelineEntry(owner_id=owner_id, post_id=post.pk, created_at=post.created_at)
+        for post in posts for owner_id in owner_ids
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def follower_user_ids(profile):
+    # `profile.followers` holds rows with from_profile=profile; the follower is to_profile
+    return (
+        Profile.followers.through.objects
+        .filter(from_profile_id=profile.pk)
+        .values_list('to_profile__user_id', flat=True)
+    )
+
+
+def fan_out(post):
+    """
+    Pushes a new post into the author's own timeline and, unless the author is
+    above the fan-out limit, into every follower's timeline.
+    """
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """
+    fan_out() for new posts by one author, reading the followers once.
+    """
+    if not posts:
+        return
+    author_id = posts[0].author_id
+    _insert(posts, [author_id])
+    profile = Profile.objects.filter(user_id=author_id).only('pk', 'followers_count').first()
+    if profile is None or profile.followers_count > fanout_limit():
+        return
+    _push(posts, profile)
+
+
+def _push(posts, profile):
+    # Followers per insert, so one insert holds about 1000 entries
+    chunk = max(1, 1000 // len(posts))
+    batch = []
+    for user_id in follower_user_ids(profile).iterator(chunk_size=1000):
+        batch.append(user_id)
+        if len(batch) == chunk:
+            _insert(posts, batch)
+            batch = []
+    if batch:
+        _insert(posts, batch)
+
+
+def backfill_size():
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 200)
+
+
+def recent_posts(author_id, limit=None):
+    return list(
+        Post.objects
+        .filter(author_id=author_id, is_active=True, is_show=True)
+        .order_by('-created_at', '-id')
+        .only('id', 'created_at')[:backfill_size() if limit is None else limit]
+    )
+
+
+def backfill(owner_id, author_id, limit=None):
+    """
+    Copies the author's most recent posts into the owner's timeline, e.g.
+    right after the owner follows the author.
+    """
+    _insert(recent_posts(author_id, limit), [owner_id])
+
+
+def push_author(author_id):
+    """
+    Backfills the author's most recent posts into every follower's timeline,
+    unless the author is (again) above the fan-out limit.
+    """
+    profile = Profile.objects.filter(user_id=author_id).only('pk', 'followers_count').first()
+    if profile is None or profile.followers_count > fanout_limit():
+        return
+    posts = recent_posts(author_id)
+    if posts:
+        _push(posts, profile)
+
+
+def remove_author(owner_id, author_id):
+    TimelineEntry.objects.filter(owner_id=owner_id, post__author_id=author_id).delete()
+
+
+def followed_author_ids(user_id):
+    """
+    (user id, follower count) of every author `user_id` follows.
+    """
+    return (
+        Profile.followers.through.objects
+        .filter(to_profile__user_id=user_id)
+        .values_list('from_profile__user_id', 'from_profile__followers_count')
+    )
+
+
+def rebuild(user_id):
+    """
+    Backfills a user's timeline from their own posts and every followed
+    author that is fanned out on write.
+    """
+    backfill(user_id, user_id)
+    for author_id, followers_count in followed_author_ids(user_id):
+        if followers_count <= fanout_limit():
+            backfill(user_id, author_id)
+
+
+def pulled_author_ids(user):
+    """
+    Followed authors whose posts are read on demand instead of fanned out.
+    """
+    return list(
+        Profile.followers.through.objects
+        .filter(to_profile__user_id=user.pk, from_profile__followers_count__gt=fanout_limit())
+        .values_list('from_profile__user_id', flat=True)
+    )
+
+
+def get_timeline_page(request, user):
+    """
+    One cursor page of `user`'s timeline. Returns a CursorPage whose items
+    are post ids, newest first.
+    """
+    page_size = get_page_size(request)
+    position, direction = get_cursor(request)
+    limit = page_size + 1
+
+    # Each source yields its `limit` rows closest to the cursor, so the
+    # `limit` closest rows of the merged timeline are among them
+    pushed = TimelineEntry.objects.filter(owner=user, post__is_active=True, post__is_show=True)
+    positions = {
+        post_id: created_at
+        for created_at, post_id in window(
+            pushed.values_list('created_at', 'post_id'), position, direction, limit, keys=('created_at', 'post_id')
+        )
+    }
+    authors = pulled_author_ids(user)
+    if authors:
+        pulled = Post.objects.filter(author_id__in=authors, is_active=True, is_show=True)
+        for created_at, post_id in window(pulled.values_list('created_at', 'id'), position, direction, limit):
+            positions[post_id] = created_at
+
+    merged = sorted(((created_at, post_id) for post_id, created_at in positions.items()), reverse=True)
+    rows = merged[-limit:] if direction == PREV else merged[:limit]
+    page = build_page(rows, page_size, direction, lambda row: row)
+    page.items = [post_id for _, post_id in page.items]
+    return page
+
+
+# --- Signals ---
+
+@receiver(m2m_changed, sender=Profile.followers.through)
+def followers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Runs after set_follow() has moved the counters: an author now exactly at
+    # the limit just went from read-on-demand back to fanned out
+    if action != 'post_remove':
+        return
+    author_profile_ids = pk_set if reverse else {instance.pk}
+    crossed = Profile.objects.filter(pk__in=author_profile_ids, followers_count=fanout_limit())
+    for author_id in crossed.values_list('user_id', flat=True):
+        enqueue('timeline.push_author', key=f'timeline:author:{author_id}', author_id=author_id)
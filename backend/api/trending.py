@@ -0,0 +1,204 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import get_cache, stats
+from .models import Comment, Like, Post
+
+
+# Trending feed (/api/posts/trending/): posts ranked by time-decayed engagement.
+# A like or comment is worth LIKE_WEIGHT or COMMENT_WEIGHT when it is made and
+# halves every TRENDING_HALF_LIFE_HOURS from its own timestamp. The score is
+# maintained incrementally: new engagement adds its full weight in the same
+# kind of single UPDATE the counters use, and `manage.py decay_trending` runs
+# periodically and multiplies all scores by 0.5 ** (elapsed / half-life),
+# which keeps them decayed without aggregating the likes and comments tables.
+# A deleted comment takes back its decayed weight. An unlike cannot, as the
+# like row is gone by then, so the post is rescore()d from the tables instead;
+# --recompute does that for every post.
+#
+# Reads never aggregate: the top TRENDING_TOP_K ids per category (and overall)
+# are the head of a partial index on the score, and that id list is kept in
+# the API cache for TRENDING_REFRESH_SECONDS, so a page costs the same however
+# many posts there are. Rankings may lag by up to that long; post edits and
+# deletes drop the affected lists right away.
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+# Scores below this are zeroed by decay(), so old posts leave the index head
+MIN_SCORE = 0.01
+
+
+def half_life_hours():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24)
+
+
+def top_k():
+    return getattr(settings, 'TRENDING_TOP_K', 100)
+
+
+def refresh_seconds():
+    return getattr(settings, 'TRENDING_REFRESH_SECONDS', 60)
+
+
+def decay_factor(hours):
+    return 0.5 ** (hours / half_life_hours())
+
+
+def top_key(category_id=None):
+    return f'api:trending:{category_id or "all"}'
+
+
+# --- Scores ---
+
+def add_scores(deltas):
+    """
+    Adds `deltas` (post id -> score delta) to the posts' trending scores in
+    one UPDATE. Never goes below zero.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    change = Case(
+        *[When(pk=pk, then=Value(float(delta))) for pk, delta in deltas.items()],
+        default=Value(0.0), output_field=FloatField(),
+    )
+    Post.objects.filter(pk__in=deltas).update(trending_score=Greatest(F('trending_score') + change, Value(0.0)))
+
+
+def comments_added(counts):
+    """
+    Scores new comments; `counts` maps post id -> comments added. For writes
+    that skip the signals (bulk_create).
+    """
+    add_scores({pk: COMMENT_WEIGHT * count for pk, count in counts.items()})
+
+
+def decay(hours):
+    """
+    Ages every score by `hours`. Returns the number of posts touched.
+    """
+    factor = decay_factor(hours)
+    return Post.objects.filter(trending_score__gt=0).update(trending_score=Case(
+        When(trending_score__lt=MIN_SCORE / factor, then=Value(0.0)),
+        default=F('trending_score') * factor,
+        output_field=FloatField(),
+    ))
+
+
+def recompute(now=None, batch_size=1000, post_ids=None):
+    """
+    Rebuilds the scores from the likes and comments tables, of every post or
+    only of `post_ids`, decaying each like and comment from its own creation
+    time. Engagement older than ten half-lives (under 0.1% of its weight) is
+    left out. Returns the number of posts with a score.
+    """
+    now = now or timezone.now()
+    horizon = now - timedelta(hours=10 * half_life_hours())
+    posts = Post.objects.all()
+    engagement = [
+        (LIKE_WEIGHT, Like.objects.filter(created_at__gte=horizon)),
+        (COMMENT_WEIGHT, Comment.objects.filter(created_at__gte=horizon)),
+    ]
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+        engagement = [(weight, rows.filter(post_id__in=post_ids)) for weight, rows in engagement]
+
+    scores = {}
+    for weight, rows in engagement:
+        for post_id, created_at in rows.values_list('post_id', 'created_at').iterator(batch_size):
+            age = (now - created_at).total_seconds() / 3600
+            scores[post_id] = scores.get(post_id, 0) + weight * decay_factor(age)
+
+    posts.filter(trending_score__gt=0).exclude(pk__in=scores).update(trending_score=0)
+    Post.objects.bulk_update(
+        [Post(pk=pk, trending_score=score) for pk, score in scores.items()], ['trending_score'], batch_size=batch_size,
+    )
+    return len(scores)
+
+
+def rescore(post_ids):
+    """
+    recompute() for a few posts, after engagement was taken back.
+    """
+    if post_ids:
+        recompute(post_ids=list(post_ids))
+
+
+# --- Reads ---
+
+def top_post_ids(category_id=None):
+    """
+    Ids of the TRENDING_TOP_K highest scored visible posts, best first, in
+    `category_id` or overall.
+    """
+    cache = get_cache()
+    key = top_key(category_id)
+    post_ids = cache.get(key)
+    if post_ids is not None:
+        stats.record('trending', hits=1)
+        return post_ids
+    stats.record('trending', misses=1)
+    posts = Post.objects.filter(is_active=True, is_show=True, trending_score__gt=0)
+    if category_id is not None:
+        posts = posts.filter(category_id=category_id)
+    post_ids = list(posts.order_by('-trending_score', '-id').values_list('pk', flat=True)[:top_k()])
+    cache.set(key, post_ids, refresh_seconds())
+    return post_ids
+
+
+def invalidate(category_ids=()):
+    keys = [top_key()] + [top_key(pk) for pk in category_ids if pk is not None]
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+# --- Signals ---
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Clearing a post's likes only happens on delete
+    if action == 'pre_clear' and reverse:
+        instance._trending_cleared = list(instance.liked_posts.values_list('pk', flat=True))
+    elif action == 'post_clear' and reverse:
+        rescore(getattr(instance, '_trending_cleared', ()))
+    elif action == 'post_add':
+        if reverse:
+            add_scores(dict.fromkeys(pk_set, LIKE_WEIGHT))
+        else:
+            add_scores({instance.pk: LIKE_WEIGHT * len(pk_set)})
+    elif action == 'post_remove':
+        rescore(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        comments_added({instance.post_id: 1})
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Take back what is left of its weight
+    age = (timezone.now() - instance.created_at).total_seconds() / 3600
+    add_scores({instance.post_id: -COMMENT_WEIGHT * decay_factor(age)})
+
+
+@receiver(post_init, sender=Post)
+def remember_category(sender, instance, **kwargs):
+    # Without loading it when the query deferred it
+    instance._initial_category_id = instance.__dict__.get('category_id')
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    # A hidden or deleted post should drop out of the lists right away, and a
+    # recategorized one out of its previous category's list
+    invalidate({instance._initial_category_id, instance.category_id})
+    instance._initial_category_id = instance.category_id
@@ -1,24 +1,42 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 from .views import RegisterView
 
+# Hot read endpoints: async under ASGI (see api.async_views)
+reads = async_views if settings.API_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('posts/', views.get_posts, name='get_posts'),
+    path('posts/', reads.get_posts, name='get_posts'),
+    path('posts/changes/', views.get_post_changes, name='get_post_changes'),
+    path('posts/trending/', views.get_trending, name='get_trending'),
+    path('timeline/', views.get_timeline, name='get_timeline'),
+    path('search/', views.search_posts, name='search_posts'),
     path('posts/create/', views.create_post, name='create_post'),
+    path('posts/batch/', views.batch_create_posts, name='batch_create_posts'),
+    path('comments/batch/', views.batch_add_comments, name='batch_add_comments'),
+    path('likes/batch/', views.batch_set_likes, name='batch_set_likes'),
     path('logout/', views.LogoutView.as_view(), name='auth_logout'),
-    path('profile/', views.get_user_profile, name='get_user_profile'),
+    path('profile/', reads.get_user_profile, name='get_user_profile'),
     path('register/', RegisterView.as_view(), name='auth_register'),
     path('my-posts/', views.get_my_posts, name='get_my_posts'),
     path('posts/update/<int:pk>/', views.update_post, name='update_post'),
     path('posts/delete/<int:pk>/', views.delete_post, name='delete_post'),
     
-    path('categories/', views.get_categories, name='get_categories'),
+    path('images/<str:key>/', views.get_image, name='get_image'),
+    path('images/<str:key>/<str:variant>/', views.get_image, name='get_image_variant'),
+
+    path('categories/', reads.get_categories, name='get_categories'),
+    path('export/<str:kind>/', views.export_data, name='export_data'),
+    path('cache/stats/', views.get_cache_stats, name='get_cache_stats'),
+    path('metrics/', views.get_metrics, name='get_metrics'),
+    path('posts/<int:post_id>/comments/', views.get_comments, name='get_comments'),
     path('posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
     path('posts/<int:post_id>/like/', views.toggle_like, name='toggle_like'),
 
     path('profile/update/', views.update_profile, name='update_profile'),
     
-    path('profile/<str:username>/', views.get_profile, name='get_profile'),
+    path('profile/<str:username>/', reads.get_profile, name='get_profile'),
     
     path('profile/<str:username>/follow/', views.toggle_follow, name='toggle_follow'),
 ]
\ No newline at end of file
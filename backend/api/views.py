@@ -1,30 +1,164 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Post, Profile, Comment, Category
+from .models import Post, Profile, Comment, ImageBlob, profile_for
 from rest_framework import generics
-from rest_framework.permissions import AllowAny
-from .serializers import PostSerializer, RegisterSerializer, ProfileSerializer, CommentSerializer, CategorySerializer
+from rest_framework.permissions import AllowAny, IsAdminUser
+from .serializers import PostSerializer, RegisterSerializer, ProfileSerializer, CommentSerializer
+from .pagination import paginate, get_page_size
+from .fieldsets import requested_fields
+from .cache import (
+    render_posts, render_profile, category_list, post_versions, post_list_version, profile_version,
+    stats as cache_stats,
+)
+from .conditional import Validators
+from .changes import changes_since, current_position, decode_token, encode_token, is_expired
+from .queries import liked_post_ids, is_following
+from .storage import get_storage
+from .counters import bump
+from .relations import set_like, set_follow
+from .metrics import metrics
+from .batch import get_items, create_posts, add_comments, set_like_items, results as batch_results
+from .search import get_search_backend
+from .export import KINDS as EXPORT_KINDS, parse_filters, export_lines, gzipped
+from .trending import top_post_ids
+from .timeline import fan_out, backfill, remove_author, fanout_limit, get_timeline_page
+from .images import VARIANTS, FULL, variant_key, sniff_content_type
 
 
+def _post_page_validators(request, post_ids, fields, versions=(), viewer_state=()):
+    # ETag/Last-Modified for a page of posts (plus anything else in the
+    # response), from versions and the viewer's likes only; see api.conditional
+    liked = None
+    if fields is None or 'is_liked' in fields:
+        liked = liked_post_ids(request.user, post_ids)
+    validators = Validators(
+        request, [post_list_version(), *versions, *post_versions(post_ids)], sorted(liked or ()), *viewer_state
+    )
+    return validators, liked
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_posts(request):
-    posts = Post.objects.filter(is_active=True, is_show=True).order_by('-created_at')
-    serializer = PostSerializer(posts, many=True, context={'request': request}) 
-    return Response(serializer.data)
+    fields = requested_fields(request, PostSerializer)
+    posts = Post.objects.filter(is_active=True, is_show=True).only('id', 'created_at')
+    page = paginate(request, posts)
+    post_ids = [post.id for post in page.items]
+    validators, liked = _post_page_validators(request, post_ids, fields)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(Response(page.response_data(render_posts(request, post_ids, fields, liked))))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_my_posts(request):
-    posts = Post.objects.filter(author=request.user).order_by('-created_at')
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    fields = requested_fields(request, PostSerializer)
+    posts = Post.objects.filter(author=request.user).only('id', 'created_at')
+    page = paginate(request, posts)
+    post_ids = [post.id for post in page.items]
+    validators, liked = _post_page_validators(request, post_ids, fields)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(Response(page.response_data(render_posts(request, post_ids, fields, liked))))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_timeline(request):
+    # Posts from the people you follow (and your own), see api.timeline
+    fields = requested_fields(request, PostSerializer)
+    page = get_timeline_page(request, request.user)
+    return Response(page.response_data(render_posts(request, page.items, fields)))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_posts(request):
+    # Ranked full-text search over posts and their comments (?q=&category=&page=)
+    query = request.query_params.get('q', '').strip()
+    fields = requested_fields(request, PostSerializer)
+    page_size = get_page_size(request)
+    try:
+        page_number = int(request.query_params.get('page', 1))
+        category = request.query_params.get('category')
+        category = int(category) if category else None
+    except ValueError:
+        return Response({'error': 'page and category must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if page_number < 1:
+        return Response({'error': 'page must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # One extra id tells us whether another page exists
+    ids = get_search_backend().search(
+        query, category=category, limit=page_size + 1, offset=(page_number - 1) * page_size
+    )
+    return Response({
+        'results': render_posts(request, ids[:page_size], fields),
+        'page': page_number,
+        'next_page': page_number + 1 if len(ids) > page_size else None,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_trending(request):
+    # Posts ranked by decayed likes and comments (?category=&page=), see api.trending
+    fields = requested_fields(request, PostSerializer)
+    page_size = get_page_size(request)
+    try:
+        page_number = int(request.query_params.get('page', 1))
+        category = request.query_params.get('category')
+        category = int(category) if category else None
+    except ValueError:
+        return Response({'error': 'page and category must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if page_number < 1:
+        return Response({'error': 'page must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+
+    ids = top_post_ids(category)
+    start = (page_number - 1) * page_size
+    return Response({
+        'results': render_posts(request, ids[start:start + page_size], fields),
+        'page': page_number,
+        'next_page': page_number + 1 if len(ids) > start + page_size else None,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_post_changes(request):
+    # Delta sync for the feed: what changed since ?since=<token>, see api.changes.
+    # No token (or an expired one) means "re-fetch the feed, then sync from `token`".
+    fields = requested_fields(request, PostSerializer)
+    since = request.query_params.get('since')
+    position, issued_at = decode_token(since) if since else (None, None)
+    if position is None or is_expired(issued_at):
+        return Response({
+            'changed': [], 'counts': [], 'removed': [],
+            'token': encode_token(current_position()), 'has_more': False, 'reset': True,
+        })
+
+    changes = changes_since(position, get_page_size(request))
+    liked = liked_post_ids(request.user, changes.changed + list(changes.counts))
+    counts = [
+        {'id': pk, 'likes_count': likes_count, 'comments_count': comments_count, 'is_liked': pk in liked}
+        for pk, (likes_count, comments_count) in changes.counts.items()
+    ]
+    return Response({
+        'changed': render_posts(request, changes.changed, fields, liked),
+        'counts': counts,
+        'removed': changes.removed,
+        'token': encode_token(changes.position),
+        'has_more': changes.has_more,
+        'reset': False,
+    })
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
@@ -38,10 +172,11 @@ def update_post(request, pk):
     if post.author != request.user:
         return Response({"error": "You cannot edit someone else's post"}, status=status.HTTP_403_FORBIDDEN)
 
-    serializer = PostSerializer(post, data=request.data, partial=True)
+    fields = requested_fields(request, PostSerializer)
+    serializer = PostSerializer(post, data=request.data, partial=True, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data)
+        post = serializer.save()
+        return Response(PostSerializer(post, fields=fields, context={'request': request}).data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -51,11 +186,13 @@ def create_post(request):
     data = request.data
     # FIX: Added context={'request': request}
     # Without this, 'get_is_liked' in serializer will fail and cause a 500 error
+    fields = requested_fields(request, PostSerializer)
     serializer = PostSerializer(data=data, context={'request': request})
     
     if serializer.is_valid():
-        serializer.save(author=request.user)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        post = serializer.save(author=request.user)
+        fan_out(post)
+        return Response(PostSerializer(post, fields=fields, context={'request': request}).data, status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -77,11 +214,15 @@ class LogoutView(APIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request):
-    user = request.user
-    # Improvement: Using ProfileSerializer ensures consistent data (images, bio, etc.)
-    # If you prefer the simple version, you can keep the dictionary method.
-    serializer = ProfileSerializer(user.profile, context={'request': request})
-    return Response(serializer.data)
+    # Shared profile summary from the cache, is_following patched in per viewer
+    validators = Validators(request, [profile_version(request.user.username)])
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    profile = render_profile(request, request.user.username, requested_fields(request, ProfileSerializer))
+    if profile is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return validators.apply(Response(profile))
 
 
 class RegisterView(generics.CreateAPIView):
@@ -109,90 +250,242 @@ def delete_post(request, pk):
 
 @api_view(['GET'])
 def get_categories(request):
-    categories = Category.objects.all()
-    serializer = CategorySerializer(categories, many=True)
-    return Response(serializer.data)
+    return Response(category_list())
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    serializer = CommentSerializer(data=request.data)
+    serializer = CommentSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        serializer.save(user=request.user, post=post)
+        with transaction.atomic():
+            serializer.save(user=request.user, post=post)
+            bump(Post, post.pk, comments_count=1)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_comments(request, post_id):
+    # Newest first; `next` pages towards older comments
+    fields = requested_fields(request, CommentSerializer)
+    # Hidden and deactivated posts keep their comments to their author
+    visible = Q(is_active=True, is_show=True) | Q(author=request.user)
+    post = get_object_or_404(Post.objects.filter(visible).only('id'), pk=post_id)
+    comments = Comment.objects.filter(post=post)
+    if fields is None or 'user_image' in fields:
+        comments = comments.select_related('user__profile')
+    elif 'user' in fields:
+        comments = comments.select_related('user')
+    page = paginate(request, comments)
+    serializer = CommentSerializer(page.items, many=True, fields=fields, context={'request': request})
+    return Response(page.response_data(serializer.data))
+
+@api_view(['PUT', 'DELETE', 'POST'])
 @permission_classes([IsAuthenticated])
 def toggle_like(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
-        return Response({'status': 'unliked', 'likes_count': post.likes.count()})
+    # PUT likes, DELETE unlikes; both are idempotent and safe to retry.
+    # POST keeps the old toggle behaviour for existing clients.
+    if request.method == 'POST':
+        liked = not Post.likes.through.objects.filter(post_id=post_id, user_id=request.user.id).exists()
     else:
-        post.likes.add(request.user)
-        return Response({'status': 'liked', 'likes_count': post.likes.count()})
+        liked = request.method == 'PUT'
+
+    likes_count = set_like(post_id, request.user.id, liked)
+    if likes_count is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response({'status': 'liked' if liked else 'unliked', 'is_liked': liked, 'likes_count': likes_count})
     
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_create_posts(request):
+    # Many posts in one request and one transaction; see api.batch
+    fields = requested_fields(request, PostSerializer)
+    items = get_items(request)
+    created, errors = create_posts(request.user, items, {'request': request})
+    rendered = dict(zip(created, render_posts(request, [post.pk for post in created.values()], fields)))
+    return Response(batch_results(len(items), rendered, errors))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_add_comments(request):
+    fields = requested_fields(request, CommentSerializer)
+    items = get_items(request)
+    created, errors = add_comments(request.user, items, {'request': request})
+    serializer = CommentSerializer(list(created.values()), many=True, fields=fields, context={'request': request})
+    return Response(batch_results(len(items), dict(zip(created, serializer.data)), errors))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_set_likes(request):
+    # Items are {"post": id, "liked": true/false}; idempotent like PUT/DELETE
+    items = get_items(request)
+    states, errors = set_like_items(request.user, items)
+    return Response(batch_results(len(items), states, errors, status.HTTP_200_OK))
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_profile(request, username):
-    user = get_object_or_404(User, username=username)
-    serializer = ProfileSerializer(user.profile, context={'request': request})
-    
-    # Get user's posts
-    posts = Post.objects.filter(author=user, is_active=True, is_show=True).order_by('-created_at')
-    post_serializer = PostSerializer(posts, many=True, context={'request': request})
-    
-    return Response({
-        'profile': serializer.data,
-        'posts': post_serializer.data
-    })
+    # ?profile_fields= / ?profile_omit= shape the profile, ?fields= / ?omit= the posts
+    profile_fields = requested_fields(request, ProfileSerializer, prefix='profile_')
+    post_fields = requested_fields(request, PostSerializer)
+
+    # Get user's posts (one cursor page at a time)
+    posts = Post.objects.filter(author__username=username, is_active=True, is_show=True).only('id', 'created_at')
+    page = paginate(request, posts)
+    post_ids = [post.id for post in page.items]
+
+    following = None
+    if profile_fields is None or 'is_following' in profile_fields:
+        following = is_following(request.user, username)
+    validators, liked = _post_page_validators(
+        request, post_ids, post_fields, versions=[profile_version(username)], viewer_state=[following]
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    profile = render_profile(request, username, profile_fields, following)
+    if profile is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return validators.apply(Response({
+        'profile': profile,
+        'posts': page.response_data(render_posts(request, post_ids, post_fields, liked))
+    }))
     
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_profile(request):
     user = request.user
-    profile = user.profile
+    profile = profile_for(user)
     data = request.data
+    fields = requested_fields(request, ProfileSerializer)
 
     # 1. Manually Update User Model Fields (Name, Email)
-    user_changed = False
-    if 'first_name' in data:
-        user.first_name = data['first_name']
-        user_changed = True
-    if 'last_name' in data:
-        user.last_name = data['last_name']
-        user_changed = True
-    if 'email' in data:
-        user.email = data['email']
-        user_changed = True
-    
-    if user_changed:
-        user.save()
+    user_fields = [name for name in ('first_name', 'last_name', 'email') if name in data]
+    for name in user_fields:
+        setattr(user, name, data[name])
+
+    if user_fields:
+        user.save(update_fields=user_fields)
 
     # 2. Update Profile Model Fields (Bio, Images) via Serializer
     # We pass 'partial=True' so we don't need to send every field
     serializer = ProfileSerializer(profile, data=data, partial=True, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data)
+        profile = serializer.save()
+        return Response(ProfileSerializer(profile, fields=fields, context={'request': request}).data)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
+@api_view(['PUT', 'DELETE', 'POST'])
 @permission_classes([IsAuthenticated])
 def toggle_follow(request, username):
-    target_user = get_object_or_404(User, username=username)
-    target_profile = target_user.profile
-    current_profile = request.user.profile
+    # Resolve both profile ids in one query
+    profiles = {
+        name: (profile_id, user_id)
+        for name, profile_id, user_id in Profile.objects
+        .filter(Q(user__username=username) | Q(user_id=request.user.id))
+        .values_list('user__username', 'id', 'user_id')
+    }
+    if username not in profiles:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    target_id, target_user_id = profiles[username]
+    current_id = profiles.get(request.user.username, (None, None))[0]
+    if current_id is None:
+        current_id = profile_for(request.user).pk
 
-    if current_profile == target_profile:
+    if current_id == target_id:
         return Response({'error': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if current_profile.following.filter(id=target_profile.id).exists():
-        current_profile.following.remove(target_profile)
-        return Response({'status': 'unfollowed'})
+    # PUT follows, DELETE unfollows (idempotent); POST toggles as before
+    if request.method == 'POST':
+        following = not Profile.followers.through.objects.filter(
+            from_profile_id=target_id, to_profile_id=current_id
+        ).exists()
+    else:
+        following = request.method == 'PUT'
+
+    followers_count = set_follow(current_id, target_id, following)
+
+    # Keep the home timeline in step; popular authors are merged in on read
+    if not following:
+        remove_author(request.user.id, target_user_id)
+    elif followers_count <= fanout_limit():
+        backfill(request.user.id, target_user_id)
+
+    return Response({
+        'status': 'followed' if following else 'unfollowed',
+        'is_following': following,
+        'followers_count': followers_count,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, kind):
+    # Streams posts, comments or profiles as NDJSON (?gzip=1 for a .gz), see api.export
+    if kind not in EXPORT_KINDS:
+        raise Http404
+    try:
+        chunks = export_lines(kind, parse_filters(request.query_params))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    filename = f'{kind}.ndjson'
+    if request.query_params.get('gzip') in ('1', 'true'):
+        chunks, filename = gzipped(chunks), f'{filename}.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = 'application/x-ndjson'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    # Hit/miss counts of the read cache in this process
+    return Response(cache_stats.snapshot())
+
+@require_safe
+def get_metrics(request):
+    # Plain Django view for Prometheus scrapers, which cannot log in
+    token = getattr(settings, 'API_METRICS_TOKEN', None)
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    elif not settings.DEBUG:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    body = metrics.render(cache_stats.snapshot())
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@require_safe
+def get_image(request, key, variant=FULL):
+    # Plain Django view: <img> tags cannot send a JWT, and blobs are public by key
+    if variant != FULL and variant not in VARIANTS:
+        raise Http404
+    blob = get_object_or_404(ImageBlob, pk=key)
+    etag = f'"{blob.key}.{variant}"'
+    fallback = False
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        stored_key = variant_key(blob.key, variant)
+        try:
+            f = get_storage().open(stored_key)
+        except FileNotFoundError:
+            raise Http404
+        content_type = blob.content_type
+        if stored_key != blob.key:
+            # Variants are re-encoded (PNG or JPEG), so read the type off the bytes
+            content_type = sniff_content_type(f.read(12)) or content_type
+            f.seek(0)
+        response = FileResponse(f, content_type=content_type)
+        fallback = variant != FULL and stored_key == blob.key
+    if fallback:
+        # Served the original in place of a variant that could not be rendered
+        response['Cache-Control'] = 'public, max-age=3600'
     else:
-        current_profile.following.add(target_profile)
-        return Response({'status': 'followed'})
\ No newline at end of file
+        # Content-addressed, so the bytes behind a key never change
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = etag
+    return response
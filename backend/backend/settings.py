@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times everything below (see api.metrics)
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,6 +79,82 @@ DATABASES = {
     }
 }
 
+# DATABASE_PROFILE=production tunes SQLite for concurrent requests:
+# - WAL, so readers never block the writer and the writer never blocks readers
+# - synchronous=NORMAL, which is durable in WAL mode except on power loss
+# - IMMEDIATE transactions, which wait out the busy timeout for the write lock
+#   instead of failing with "database is locked" when a read turns into a write
+# - a 64 MiB page cache and 256 MiB of memory-mapped I/O per connection
+# - persistent connections, so the pragmas run once per connection, not per request
+# Reads outside transactions go to the 'replica' alias (api.routers), a
+# read-only connection to the same file; point it at a real replica later.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    # Busy timeout, in seconds
+    'timeout': 20,
+}
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update(
+        OPTIONS=SQLITE_PRODUCTION_OPTIONS,
+        CONN_MAX_AGE=600,
+        CONN_HEALTH_CHECKS=True,
+    )
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'OPTIONS': {
+            **SQLITE_PRODUCTION_OPTIONS,
+            'init_command': SQLITE_PRODUCTION_OPTIONS['init_command'] + 'PRAGMA query_only=ON;',
+            'transaction_mode': 'DEFERRED',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Swap the backend (e.g. Redis/Memcached) for a cache shared between workers.
+
+# Size the in-process caches to the working set: LocMemCache defaults to 300
+# entries and culls a third of them when full. A post takes four entries (a
+# body per preset and a version), so does a profile; 50000 fits about 10000
+# posts with their authors. The auth cache holds one entry per active user.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    # In-process cache of authenticated users (api.authentication)
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Read endpoint cache (api.cache): which CACHES alias, and entry lifetime in seconds
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Authenticated users are resolved from this in-process cache for up to
+# API_AUTH_CACHE_TIMEOUT seconds. Saves and logouts invalidate them right away
+# only if the API cache above is shared between workers; with LocMemCache other
+# workers may accept a deactivated or logged-out user until the timeout
+API_AUTH_CACHE_ALIAS = 'auth'
+API_AUTH_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -113,13 +192,78 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Uploaded images (content-addressed blobs, see api.storage)
+MEDIA_ROOT = BASE_DIR / 'media'
+
+IMAGE_STORAGE = {
+    'BACKEND': 'api.storage.LocalBlobStorage',
+    'OPTIONS': {'location': MEDIA_ROOT / 'blobs'},
+}
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        # simplejwt's JWTAuthentication with the user and profile cached
+        'api.authentication.CachedJWTAuthentication',
+    ),
+    # Same bytes as JSONRenderer, encoded with orjson when it is installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Build cached post bodies from .values() rows instead of PostSerializer (see api.flat)
+API_FAST_RENDERING = True
+
+# Serve the hot read endpoints from api.async_views (set API_ASYNC_VIEWS=1).
+# Off by default: in `manage.py benchmark_load` they have not beaten the sync
+# DRF views under WSGI, so only turn them on where a measurement says so
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS') == '1'
+
+# Cursor pagination for the post feeds (?page_size= is capped at API_MAX_PAGE_SIZE)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Request metrics (api.metrics): requests slower than this are logged to
+# "api.slow" with their SQL. /api/metrics/ wants "Authorization: Bearer
+# <API_METRICS_TOKEN>" when the token is set, and is only open with DEBUG otherwise
+API_SLOW_REQUEST_MS = 500
+API_METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN')
+
+# Most items accepted by one batch write (posts/batch/, comments/batch/, likes/batch/)
+API_BATCH_LIMIT = 100
+
+# Latest comments embedded in every post; the rest is paged by /api/posts/<id>/comments/
+COMMENT_PREVIEW_SIZE = 3
+
+# Delta sync (/api/posts/changes/): delete tombstones are kept this long, older
+# sync tokens get a reset; prune with `manage.py compact_changes`
+CHANGE_LOG_RETENTION_DAYS = 30
+
+# Home timeline: authors above this many followers are merged in on read
+# instead of fanned out on write; a new follow backfills this many posts
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_BACKFILL_SIZE = 200
+
+# Trending feed (api.trending): scores halve every TRENDING_HALF_LIFE_HOURS
+# (run `manage.py decay_trending` every hour or so); the top TRENDING_TOP_K
+# posts per category are re-read from the index every TRENDING_REFRESH_SECONDS
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_TOP_K = 100
+TRENDING_REFRESH_SECONDS = 60
+
+# Background jobs (api.jobs): run the queue with `manage.py run_jobs`. Failed
+# jobs are retried after JOBS_RETRY_DELAY seconds, doubling each time, up to
+# JOBS_MAX_ATTEMPTS attempts. The test runner runs jobs inline instead.
+JOBS_BACKEND = 'api.jobs.DatabaseBackend'
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
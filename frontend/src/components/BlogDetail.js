@@ -1,15 +1,39 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API_BASE_URL } from '../config';
 
 const BlogDetail = ({ post, onBack, refreshPost }) => { // refreshPost is a callback to re-fetch data
     const [comment, setComment] = useState('');
     const [localPost, setLocalPost] = useState(post); // Manage local state for immediate UI updates
+    // Feed items only carry a preview of the latest comments; the full list is paged here
+    const [comments, setComments] = useState([...(post.comments || [])].reverse());
+    const [commentsCursor, setCommentsCursor] = useState(null);
+
+    const loadComments = async (cursor = null) => {
+        const token = localStorage.getItem('access_token');
+        try {
+            const res = await axios.get(`${API_BASE_URL}/api/posts/${post.id}/comments/`, {
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: cursor ? { cursor } : {}
+            });
+            setComments(prev => cursor ? [...prev, ...res.data.results] : res.data.results);
+            setCommentsCursor(res.data.next);
+        } catch (error) {
+            console.error(error);
+        }
+    };
+
+    useEffect(() => {
+        loadComments();
+    }, [post.id]);
 
     const handleLike = async () => {
         const token = localStorage.getItem('access_token');
         try {
-            const res = await axios.post(`${API_BASE_URL}/api/posts/${post.id}/like/`, {}, {
+            // PUT likes, DELETE unlikes: repeated clicks cannot double count
+            const res = await axios({
+                method: localPost.is_liked ? 'delete' : 'put',
+                url: `${API_BASE_URL}/api/posts/${post.id}/like/`,
                 headers: { 'Authorization': `Bearer ${token}` }
             });
             // Update local state immediately
@@ -31,10 +55,11 @@ const BlogDetail = ({ post, onBack, refreshPost }) => { // refreshPost is a call
                 { content: comment }, 
                 { headers: { 'Authorization': `Bearer ${token}` } }
             );
-            // Append new comment to local state
+            // Show the new comment on top and bump the count
+            setComments(prev => [res.data, ...prev]);
             setLocalPost(prev => ({
                 ...prev,
-                comments: [...prev.comments, res.data]
+                comments_count: prev.comments_count + 1
             }));
             setComment('');
         } catch (error) {
@@ -90,7 +115,7 @@ const BlogDetail = ({ post, onBack, refreshPost }) => { // refreshPost is a call
 
             {/* COMMENTS SECTION */}
             <div className="mt-8">
-                <h3 className="text-2xl font-bold mb-6">Comments ({localPost.comments.length})</h3>
+                <h3 className="text-2xl font-bold mb-6">Comments ({localPost.comments_count})</h3>
                 
                 {/* Add Comment */}
                 <form onSubmit={handleComment} className="mb-8 flex gap-4">
@@ -107,7 +132,7 @@ const BlogDetail = ({ post, onBack, refreshPost }) => { // refreshPost is a call
 
                 {/* List Comments */}
                 <div className="space-y-4">
-                    {localPost.comments.map(c => (
+                    {comments.map(c => (
                         <div key={c.id} className="bg-white p-4 rounded-lg shadow-sm border border-gray-50 flex gap-4">
                             <div className="w-10 h-10 rounded-full bg-gray-200 flex-shrink-0 overflow-hidden">
                                 {c.user_image ? <img src={c.user_image} className="w-full h-full object-cover"/> : null}
@@ -122,6 +147,11 @@ const BlogDetail = ({ post, onBack, refreshPost }) => { // refreshPost is a call
                         </div>
                     ))}
                 </div>
+                {commentsCursor && (
+                    <button onClick={() => loadComments(commentsCursor)} className="mt-4 text-blue-600 font-bold hover:underline">
+                        Load older comments
+                    </button>
+                )}
             </div>
         </div>
     );
@@ -4,6 +4,7 @@ import { API_BASE_URL } from '../config';
 
 const MyPosts = () => {
     const [posts, setPosts] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [categories, setCategories] = useState([]); // Store categories
     const [currentPost, setCurrentPost] = useState(null); // For Edit/Create Modal
     const [postToDelete, setPostToDelete] = useState(null); // For Delete Confirmation Modal
@@ -14,13 +15,16 @@ const MyPosts = () => {
         fetchCategories();
     }, []);
 
-    const fetchMyPosts = async () => {
+    // Cursor-paginated like the feed: pass the last "next" cursor to load older posts
+    const fetchMyPosts = async (cursor = null) => {
         const token = localStorage.getItem('access_token');
         try {
             const response = await axios.get(`${API_BASE_URL}/api/my-posts/`, {
-                headers: { 'Authorization': `Bearer ${token}` }
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: cursor ? { cursor } : {}
             });
-            setPosts(response.data);
+            setPosts(prev => cursor ? [...prev, ...response.data.results] : response.data.results);
+            setNextCursor(response.data.next);
         } catch (error) {
             console.error("Failed to fetch posts", error);
         }
@@ -130,7 +134,7 @@ const MyPosts = () => {
                             {/* Image */}
                             <div className="w-full h-48 md:w-32 md:h-24 bg-gray-200 rounded-lg overflow-hidden flex-shrink-0 relative group">
                                 {post.image ? (
-                                    <img src={post.image} alt="Cover" className="w-full h-full object-cover" />
+                                    <img src={post.image_preview || post.image} alt="Cover" className="w-full h-full object-cover" />
                                 ) : (
                                     <div className="w-full h-full flex items-center justify-center text-gray-400 text-3xl">📝</div>
                                 )}
@@ -178,6 +182,16 @@ const MyPosts = () => {
                     </div>
                 ))}
             </div>
+            {nextCursor && (
+                <div className="flex justify-center pt-8">
+                    <button 
+                        onClick={() => fetchMyPosts(nextCursor)}
+                        className="bg-white border border-gray-200 hover:shadow-md text-gray-700 px-6 py-2 rounded-lg font-semibold transition"
+                    >
+                        Load more
+                    </button>
+                </div>
+            )}
 
             {/* --- CREATE / EDIT MODAL --- */}
             {currentPost && (
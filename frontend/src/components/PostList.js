@@ -4,25 +4,31 @@ import { API_BASE_URL } from '../config';
 
 const PostList = ({ refreshTrigger, onPostClick }) => {
     const [posts, setPosts] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
 
-    useEffect(() => {   
-        const fetchPosts = async () => {
-            try {
-                const token = localStorage.getItem('access_token');
-                if (!token) return;
+    // The feed is cursor-paginated: pass the last "next" cursor to load older posts
+    const fetchPosts = async (cursor = null) => {
+        try {
+            const token = localStorage.getItem('access_token');
+            if (!token) return;
+
+            const response = await axios.get(`${API_BASE_URL}/api/posts/`, {
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: cursor ? { cursor } : {}
+            });
+            setPosts(prev => cursor ? [...prev, ...response.data.results] : response.data.results);
+            setNextCursor(response.data.next);
+        } catch (error) {
+            console.error("Error fetching posts", error);
+        }
+    };
 
-                const response = await axios.get(`${API_BASE_URL}/api/posts/`, {
-                    headers: { 'Authorization': `Bearer ${token}` }
-                });
-                setPosts(response.data);
-            } catch (error) {
-                console.error("Error fetching posts", error);
-            }
-        };
+    useEffect(() => {   
         fetchPosts();
     }, [refreshTrigger]);
 
     return (
+        <div>
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6 p-6">
             {posts.map(post => (
                 <div 
@@ -34,7 +40,7 @@ const PostList = ({ refreshTrigger, onPostClick }) => {
                     <div className="h-48 bg-gray-200 w-full relative">
                         {post.image ? (
                             <img 
-                                src={post.image} 
+                                src={post.image_preview || post.image} 
                                 alt={post.title} 
                                 className="w-full h-full object-cover"
                             />
@@ -94,7 +100,7 @@ const PostList = ({ refreshTrigger, onPostClick }) => {
                                         <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M8 12h.01M12 12h.01M16 12h.01M21 12c0 4.418-4.03 8-9 8a9.863 9.863 0 01-4.255-.949L3 20l1.395-3.72C3.512 15.042 3 13.574 3 12c0-4.418 4.03-8 9-8s9 3.582 9 8z" />
                                     </svg>
                                     <span className="font-medium">
-                                        {post.comments ? post.comments.length : 0}
+                                        {post.comments_count}
                                     </span>
                                 </div>
 
@@ -105,6 +111,17 @@ const PostList = ({ refreshTrigger, onPostClick }) => {
                 </div>
             ))}
         </div>
+        {nextCursor && (
+            <div className="flex justify-center pb-8">
+                <button 
+                    onClick={() => fetchPosts(nextCursor)}
+                    className="bg-white border border-gray-200 hover:shadow-md text-gray-700 px-6 py-2 rounded-lg font-semibold transition"
+                >
+                    Load more
+                </button>
+            </div>
+        )}
+        </div>
     );
 };
 
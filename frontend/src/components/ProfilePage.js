@@ -5,6 +5,7 @@ import { API_BASE_URL } from '../config';
 const ProfilePage = ({ username, currentUser, onPostClick, onLogout }) => {
     const [profile, setProfile] = useState(null);
     const [posts, setPosts] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [isEditing, setIsEditing] = useState(false);
     
     // Edit Form State
@@ -28,13 +29,29 @@ const ProfilePage = ({ username, currentUser, onPostClick, onLogout }) => {
                 headers: { 'Authorization': `Bearer ${token}` }
             });
             setProfile(res.data.profile);
-            setPosts(res.data.posts);
+            setPosts(res.data.posts.results);
+            setNextCursor(res.data.posts.next);
             setEditData(res.data.profile);
         } catch (error) {
             console.error("Error fetching profile", error);
         }
     };
 
+    // The posts are cursor-paginated: pass the last "next" cursor to load older ones
+    const fetchMorePosts = async () => {
+        const token = localStorage.getItem('access_token');
+        try {
+            const res = await axios.get(`${API_BASE_URL}/api/profile/${username}/`, {
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: { cursor: nextCursor, profile_fields: 'username' }
+            });
+            setPosts(prev => [...prev, ...res.data.posts.results]);
+            setNextCursor(res.data.posts.next);
+        } catch (error) {
+            console.error("Error fetching posts", error);
+        }
+    };
+
     const handleUpdateProfile = async (e) => {
         e.preventDefault();
         const token = localStorage.getItem('access_token');
@@ -64,7 +81,9 @@ const ProfilePage = ({ username, currentUser, onPostClick, onLogout }) => {
     const handleFollow = async () => {
         const token = localStorage.getItem('access_token');
         try {
-            await axios.post(`${API_BASE_URL}/api/profile/${username}/follow/`, {}, {
+            await axios({
+                method: profile.is_following ? 'delete' : 'put',
+                url: `${API_BASE_URL}/api/profile/${username}/follow/`,
                 headers: { 'Authorization': `Bearer ${token}` }
             });
             fetchProfile(); 
@@ -193,17 +212,27 @@ const ProfilePage = ({ username, currentUser, onPostClick, onLogout }) => {
                     ) : (
                         posts.map(post => (
                             <div key={post.id} onClick={() => onPostClick(post)} className="bg-white rounded-xl shadow-sm border border-gray-100 overflow-hidden cursor-pointer hover:shadow-md transition">
-                                {post.image && <div className="h-64 w-full bg-gray-100"><img src={post.image} alt="Post" className="w-full h-full object-cover" /></div>}
+                                {post.image && <div className="h-64 w-full bg-gray-100"><img src={post.image_preview || post.image} alt="Post" className="w-full h-full object-cover" /></div>}
                                 <div className="p-6">
                                     <h3 className="font-bold text-xl text-gray-900 mb-2">{post.title}</h3>
                                     <p className="text-gray-600 text-sm line-clamp-2 mb-4">{post.content}</p>
                                     <div className="flex gap-6 text-gray-500 text-sm pt-4 border-t">
-                                        <span>❤️ {post.likes_count}</span><span>💬 {post.comments.length}</span>
+                                        <span>❤️ {post.likes_count}</span><span>💬 {post.comments_count}</span>
                                     </div>
                                 </div>
                             </div>
                         ))
                     )}
+                    {nextCursor && (
+                        <div className="flex justify-center">
+                            <button 
+                                onClick={fetchMorePosts}
+                                className="bg-white border border-gray-200 hover:shadow-md text-gray-700 px-6 py-2 rounded-lg font-semibold transition"
+                            >
+                                Load more
+                            </button>
+                        </div>
+                    )}
                 </div>
             </div>
         </div>